@@ -0,0 +1,541 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2010 Ron Huang
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+
+import time
+import logging
+try:
+    import resource
+except ImportError:
+    # not available in the App Engine sandbox
+    resource = None
+try:
+    from google.appengine.api import runtime
+except ImportError:
+    # only in newer SDKs
+    runtime = None
+from google.appengine.ext import db
+from google.appengine.api.labs import taskqueue
+import tweepy
+from tweepy import Cursor
+from configs import CONSUMER_KEY, CONSUMER_SECRET
+from models import User, RetweetIndex
+from matcher import Matcher
+import outbox
+import watermark
+import scheduler
+from utils import MemcacheCache
+from tweepy.utils import threads_available
+
+
+SHARD_SIZE = 20 # criteria per /collect task
+COLLECT_QUEUE = 'collect' # incremental collection, see queue.yaml
+BACKFILL_QUEUE = 'backfill' # first runs and backlogs
+IN_QUERY_LIMIT = 30 # maximum values accepted by a datastore IN filter
+PER_PAGE = 200 # tweets per list timeline page, the most Twitter allows
+MAX_PAGES = 4 # list timeline pages fetched per list and run
+BATCH_SIZE = 100 # matched ids written to the outbox at once
+RETWEETS_PER_PAGE = 100 # the most retweeted_by_me returns per page
+FETCH_TIMEOUT = 10 # seconds a single Twitter request may take
+COLLECT_DEADLINE = watermark.TASK_DEADLINE - 10 # seconds a shard may fetch
+# CPU seconds a term may spend matching per run, its share of the shard
+MATCH_BUDGET = float(COLLECT_DEADLINE) / SHARD_SIZE
+FETCH_WORKERS = 4 # timelines fetched at once per shard
+BACKFILL_DEFER = watermark.LEASE # seconds moved criteria wait for backfill
+PREFETCH_PAGES = 0 # pages fetched ahead while the previous one is matched,
+                   # the python runtime does not allow threads
+
+
+# list timeline pages are shared for the rest of the trigger cycle.
+TIMELINE_CACHE = MemcacheCache(timeout=(scheduler.MIN_INTERVAL - 1) * 60,
+                               namespace='timeline')
+
+
+# rate limit status of every access token, shared by all instances.
+RATE_LIMITER = tweepy.RateLimiter(
+    cache=MemcacheCache(timeout=60 * 60, namespace='ratelimit'), max_wait=2)
+
+
+# keep-alive connections to Twitter, shared by all requests of the instance.
+CONNECTION_POOL = tweepy.ConnectionPool()
+
+
+# short jittered backoff, so failing tasks neither retry in lockstep nor
+# run into their deadline.
+RETRY_POLICY = tweepy.BackoffRetry(count=2, delay=1, max_delay=5)
+
+
+def get_api(user, cache=None):
+    auth = tweepy.OAuthHandler(CONSUMER_KEY, CONSUMER_SECRET)
+    auth.set_access_token(user.token_key, user.token_secret)
+    return tweepy.API(auth, cache=cache, rate_limiter=RATE_LIMITER,
+                      pool=CONNECTION_POOL, timeout=FETCH_TIMEOUT,
+                      retry_policy=RETRY_POLICY)
+
+
+def get_users(screen_names):
+    """Fetch the users with the given screen names, keyed by screen name."""
+    names = list(set(screen_names))
+    users = {}
+    for i in range(0, len(names), IN_QUERY_LIMIT):
+        chunk = names[i:i + IN_QUERY_LIMIT]
+        for u in User.gql("WHERE screen_name IN :names", names=chunk):
+            users[u.screen_name] = u
+    return users
+
+
+def memory_usage():
+    """Return the memory used by the process in MB, if known.
+
+    Without the App Engine runtime API this is the peak resident memory
+    of the process, whose growth still shows what a shard added to it.
+    """
+    if runtime is not None:
+        return runtime.memory_usage().current()
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return None
+
+
+class ShardStats(object):
+    """Counters reported at the end of each collection shard."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.criteria = 0
+        self.failed = 0
+        self.timelines = 0
+        self.tweets = 0
+        self.retweets = 0
+        self.checkpoints = 0
+        self.peak_batch = 0
+        self.slowest = (0.0, None)
+        self.pool = (CONNECTION_POOL.hits, CONNECTION_POOL.misses)
+        self.memory = memory_usage()
+        self.memory_growth = 0.0
+
+    def sample_memory(self):
+        """Note how far memory grew since the shard started."""
+        if self.memory is not None:
+            self.memory_growth = max(self.memory_growth,
+                                     memory_usage() - self.memory)
+
+    def account(self, criterion):
+        if criterion.match_time > self.slowest[0]:
+            self.slowest = (criterion.match_time, criterion)
+
+    def report(self):
+        elapsed = max(time.time() - self.started, 0.001)
+        logging.info("Collected %d criteria (%d failed) in %.2fs: "
+                     "%.1f criteria/s, %d timelines fetched, "
+                     "%d tweets scanned, %d retweets queued, "
+                     "%d timelines stopped at the deadline.",
+                     self.criteria, self.failed, elapsed,
+                     self.criteria / elapsed, self.timelines,
+                     self.tweets, self.retweets, self.checkpoints)
+        self.sample_memory()
+        if self.memory is None:
+            logging.info("Memory use unknown, %d matched ids buffered.",
+                         self.peak_batch)
+        else:
+            logging.info("Memory grew by up to %.1f MB from %.1f MB, "
+                         "%d matched ids buffered.", self.memory_growth,
+                         self.memory, self.peak_batch)
+        logging.info("Connection pool: %d reused, %d opened.",
+                     CONNECTION_POOL.hits - self.pool[0],
+                     CONNECTION_POOL.misses - self.pool[1])
+        elapsed, c = self.slowest
+        if c is not None:
+            logging.info("Slowest term: %r of %s, %.3fs matching.",
+                         c.term, c.screen_name, elapsed)
+
+
+def get_retweet_index(user, deadline=None):
+    """Load the user's retweet index.
+
+    The first time, the index is built from the tweets the user already
+    retweeted, after that it is kept up to date by the outbox. The build
+    is saved after every page, and when it stops at the deadline or the
+    rate limit, the next call resumes it. Meanwhile the partial index is
+    used, Twitter refuses the few retweets it lets through twice.
+    """
+    index = RetweetIndex.get_by_key_name(user.screen_name)
+    if index is None:
+        index = RetweetIndex(key_name=user.screen_name, complete=False)
+    if index.complete:
+        return index
+
+    api = get_api(user)
+    cursor = Cursor(api.retweeted_by_me, count=RETWEETS_PER_PAGE,
+                    max_id=index.max_id, deadline=deadline)
+    # a short page is the last one, no need to fetch an empty one after it
+    pages = cursor.pages(page_size=RETWEETS_PER_PAGE)
+    try:
+        for page in pages:
+            index.add([t.retweeted_status.id for t in page])
+            index.max_id = page[-1].id - 1
+            index.put()
+        index.complete = True
+        index.max_id = None
+    except tweepy.TweepError, e:
+        logging.warning("Retweet index of %s is incomplete: %s",
+                        user.screen_name, e)
+    index.put()
+    return index
+
+
+class Progress(object):
+    """Integer watermarks of one timeline walk."""
+
+    def __init__(self):
+        self.pages = 0
+        self.tweets = 0
+        self.complete = True
+        self.top_id = None
+        self.oldest_id = None
+
+
+def timeline_params(owner, slug, since_id, max_id, deadline):
+    # shared by fetch_pages() and prefetch(), so their requests and
+    # TIMELINE_CACHE keys are the same
+    return {'owner': owner, 'slug': slug, 'since_id': since_id or 1,
+            'max_id': max_id, 'per_page': PER_PAGE, 'deadline': deadline}
+
+
+def prefetch(claimed, users, deadline):
+    """Fetch the first page of every claimed list timeline at once.
+
+    Up to FETCH_WORKERS requests are in flight together. The pages land
+    in TIMELINE_CACHE, where collect() finds them. Errors are left for
+    collect() to run into again. Nothing is gained without threads, so
+    nothing is fetched then.
+    """
+    if not threads_available():
+        return
+
+    calls = []
+    for screen_name, (user_criteria, marks) in claimed.items():
+        api = get_api(users[screen_name], TIMELINE_CACHE)
+        for list_id, mark in marks.items():
+            calls.append((api, timeline_params(screen_name, list_id,
+                                               mark.since_id, mark.max_id,
+                                               deadline)))
+    if len(calls) < 2:
+        return
+
+    executor = tweepy.Executor(FETCH_WORKERS)
+    futures = [executor.submit(api.list_timeline, page=1, **params)
+               for api, params in calls]
+    tweepy.gather(futures, return_errors=True)
+    executor.shutdown()
+
+
+def fetch_pages(api, owner, slug, since_id, max_id, progress, stats,
+                deadline=None):
+    """Yield the list timeline pages in (since_id, max_id], newest first.
+
+    At most MAX_PAGES pages of PER_PAGE tweets are fetched, and none after
+    the deadline. progress tells whether the whole window was.
+
+    api should be built with TIMELINE_CACHE, so a page already pulled by
+    another task during this trigger cycle is not requested again.
+    """
+    stats.timelines += 1
+    cursor = Cursor(api.list_timeline,
+                    **timeline_params(owner, slug, since_id, max_id, deadline))
+    # ends at since_id or at a short page, without fetching another page
+    pages = cursor.pages(MAX_PAGES, PREFETCH_PAGES, since_id=since_id,
+                         page_size=PER_PAGE)
+    try:
+        while True:
+            try:
+                page = pages.next()
+            except StopIteration:
+                break
+            except tweepy.DeadlineExceeded:
+                # the next run resumes below the last page fetched
+                stats.checkpoints += 1
+                progress.complete = False
+                return
+            progress.pages += 1
+            # a short page is the last one
+            progress.complete = len(page) < PER_PAGE
+            yield page
+    finally:
+        # stop fetching ahead if the caller gave up early
+        pages.close()
+    if progress.pages < MAX_PAGES:
+        progress.complete = True
+
+
+def parse_tweets(pages, progress, stats):
+    """Yield (id, text) of the tweets, dropping each page once read."""
+    for page in pages:
+        stats.sample_memory()
+        for t in page:
+            stats.tweets += 1
+            progress.tweets += 1
+            if progress.top_id is None or progress.top_id < t.id:
+                progress.top_id = t.id
+            progress.oldest_id = t.id
+            yield t.id, t.text
+
+
+def match_tweets(tweets, matcher, counts):
+    """Yield the ids of the tweets matching any term of the matcher.
+
+    counts is incremented at the index of every matching term.
+    """
+    for tweet_id, text in tweets:
+        found = matcher.matches(text)
+        if found:
+            for i in found:
+                counts[i] += 1
+            yield tweet_id
+
+
+class OutboxWriter(object):
+    """Queue matched tweets in the user's outbox, BATCH_SIZE at a time.
+
+    The outbox is drained oldest first, so matches can be written in the
+    newest first order they are found in.
+    """
+
+    def __init__(self, user, stats, deadline=None):
+        self.user = user
+        self.stats = stats
+        self.deadline = deadline
+        self.index = None
+        self.batch = []
+        self.matched = 0
+
+    def add(self, tweet_id):
+        self.matched += 1
+        self.batch.append(tweet_id)
+        if len(self.batch) > self.stats.peak_batch:
+            self.stats.peak_batch = len(self.batch)
+        if len(self.batch) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        if self.index is None:
+            self.index = get_retweet_index(self.user, self.deadline)
+        tweet_ids = [i for i in self.batch if i not in self.index]
+        self.batch = []
+        self.stats.retweets += outbox.enqueue(self.user.screen_name,
+                                              tweet_ids)
+
+
+def next_window(mark, progress):
+    """Return the (since_id, max_id, top_id) state after a timeline walk."""
+    top_id = mark.top_id or mark.since_id or 1
+    # keep max tweet id as the next since_id
+    if progress.top_id is not None and top_id < progress.top_id:
+        top_id = progress.top_id
+    if progress.complete:
+        return (top_id, None, None)
+    if progress.oldest_id is None:
+        # stopped before the first page
+        return watermark.state(mark)
+    return (mark.since_id, progress.oldest_id - 1, top_id)
+
+
+def collect(user, criteria, marks, stats, deadline=None):
+    """Queue the new tweets of the criteria's lists that match their terms.
+
+    Every list is fetched once, however many of the user's criteria watch
+    it, and its tweets are fanned out to each of those criteria. Tweets
+    stream from fetch to outbox, only ids and watermarks are kept.
+
+    Each timeline is walked backward from its watermark's max_id, or from
+    the newest tweet, down to its since_id. When the page budget runs out
+    first, the next run resumes below the oldest tweet fetched, and
+    since_id only moves up to top_id once the whole gap is fetched.
+
+    Each criterion is rescheduled from the tweets and matches it yielded.
+
+    When the user's rate limit is reached, the criteria are deferred until
+    it is reset and the watermarks are left as they were. Lists not reached
+    before the deadline are left as they were, their criteria stay due.
+
+    marks maps the list ids to their claimed watermarks. Returns the
+    windows to pass to watermark.advance() and the number of tweets
+    matched, or None and 0 if the collection failed.
+    """
+    timeline_api = get_api(user, TIMELINE_CACHE)
+
+    watchers = {}
+    for c in criteria:
+        watchers.setdefault(c.list_id, []).append(c)
+
+    windows = {}
+    writer = OutboxWriter(user, stats, deadline)
+    yields = []
+    try:
+        for list_id, list_criteria in watchers.items():
+            mark = marks[list_id]
+            if deadline is not None and deadline.expired():
+                stats.checkpoints += 1
+                windows[list_id] = (watermark.state(mark),
+                                    watermark.state(mark))
+                continue
+
+            progress = Progress()
+            matcher = Matcher([c.term for c in list_criteria], MATCH_BUDGET)
+            counts = [0] * len(list_criteria)
+            pages = fetch_pages(timeline_api, user.screen_name, list_id,
+                                mark.since_id, mark.max_id, progress, stats,
+                                deadline)
+            for tweet_id in match_tweets(parse_tweets(pages, progress, stats),
+                                         matcher, counts):
+                writer.add(tweet_id)
+
+            window = next_window(mark, progress)
+            windows[list_id] = (watermark.state(mark), window)
+            if not progress.complete and progress.oldest_id is None:
+                # stopped at the deadline before any tweet, still due
+                continue
+
+            for c, elapsed, count in zip(list_criteria, matcher.elapsed,
+                                         counts):
+                c.match_time = elapsed
+                stats.account(c)
+                yields.append((c, progress.tweets, count, window[1] is not None))
+
+        writer.flush()
+    except tweepy.RateLimitError, e:
+        # the tweets are fetched again once the limit is reset
+        logging.warning("Deferring %s: %s", user.screen_name, e)
+        for c in criteria:
+            scheduler.defer(c, e.retry_after)
+        return watermark.unchanged(marks), 0
+    except tweepy.TweepError, e:
+        logging.error(e)
+        return None, 0
+
+    for c, tweets, matches, backlog in yields:
+        scheduler.reschedule(c, tweets, matches, backlog)
+
+    return windows, writer.matched
+
+
+def enqueue_shard(criteria, queue_name=COLLECT_QUEUE):
+    ids = ",".join([str(c.key().id()) for c in criteria])
+    taskqueue.add(url = "/collect", params = {"ids": ids},
+                  queue_name = queue_name)
+
+
+def collect_shard(keys, queue_name=COLLECT_QUEUE):
+    """Collect every criterion in the shard.
+
+    The criteria and their users are loaded with one bulk fetch each, and
+    criteria are grouped by user so every user's lists are fetched only
+    once.
+
+    Unless the shard already runs in the backfill queue, criteria whose
+    list has a backlog are moved there, so they do not hold up incremental
+    runs. They are not due again before the backfill task had time to run
+    them, so the next trigger does not move them again.
+    """
+    stats = ShardStats()
+    # leaves time to save the progress before the request is killed
+    deadline = tweepy.Deadline(COLLECT_DEADLINE)
+
+    criteria = [c for c in db.get(keys) if c is not None]
+    users = get_users([c.screen_name for c in criteria])
+
+    by_user = {}
+    for c in criteria:
+        if c.screen_name in users:
+            by_user.setdefault(c.screen_name, []).append(c)
+        else:
+            logging.error("Could not find screen name: %s.", c.screen_name)
+            stats.failed += 1
+
+    backfill = []
+    claimed = {}
+    for screen_name, user_criteria in by_user.items():
+        u = users[screen_name]
+        list_ids = list(set([c.list_id for c in user_criteria]))
+        if queue_name != BACKFILL_QUEUE:
+            marks = watermark.peek(u, list_ids)
+            backlogs = [c for c in user_criteria
+                        if watermark.needs_backfill(marks[c.list_id])]
+            if backlogs:
+                backfill.extend(backlogs)
+                user_criteria = [c for c in user_criteria
+                                 if c not in backlogs]
+                list_ids = list(set([c.list_id for c in user_criteria]))
+        if not list_ids:
+            continue
+
+        # lists claimed by an overlapping task are left to it
+        marks = watermark.claim(u, list_ids)
+        user_criteria = [c for c in user_criteria if c.list_id in marks]
+        if user_criteria:
+            claimed[screen_name] = (user_criteria, marks)
+
+    if backfill:
+        for c in backfill:
+            scheduler.defer(c, BACKFILL_DEFER)
+        db.put(backfill)
+        enqueue_shard(backfill, BACKFILL_QUEUE)
+
+    prefetch(claimed, users, deadline)
+
+    updated = []
+    outboxes = []
+    advances = []
+    for screen_name, (user_criteria, marks) in claimed.items():
+        u = users[screen_name]
+        stats.criteria += len(user_criteria)
+        windows, matched = collect(u, user_criteria, marks, stats, deadline)
+        if windows is None:
+            stats.failed += len(user_criteria)
+            windows = watermark.unchanged(marks)
+        else:
+            # the matching time and schedule of every criterion
+            updated.extend(user_criteria)
+
+        # already queued items are drained again too, in case the task
+        # that queued them failed before scheduling the drain.
+        if matched:
+            outboxes.append(screen_name)
+        advances.append((u, windows))
+
+    # the matched tweets are safe in the outboxes, watermarks can move on
+    outbox.schedule(outboxes)
+
+    for u, windows in advances:
+        watermark.advance(u, windows)
+
+    if updated:
+        db.put(updated)
+
+    stats.report()
+    return stats
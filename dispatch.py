@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2010 Ron Huang
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+import time
+from google.appengine.api import urlfetch
+import tweepy
+
+
+class Response(object):
+    """The status and headers of a urlfetch result, like an httplib one."""
+
+    def __init__(self, result):
+        self.status = result.status_code
+        self.headers = result.headers
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+
+class Call(object):
+    """A Twitter API call sent by the dispatcher, with its outcome.
+
+    context is left for the caller to tell its calls apart.
+    """
+
+    def __init__(self, key, api, method, path, context):
+        self.key = key
+        self.api = api
+        self.method = method
+        self.path = path
+        self.context = context
+        self.rpc = None
+        self.started = None
+        self.result = None
+        self.error = None
+        self.latency = None
+
+    def start(self, deadline=None):
+        api = self.api
+        url = '%s%s%s%s' % (api.secure and 'https://' or 'http://',
+                            api.host, api.api_root, self.path)
+        headers = {}
+        if api.auth:
+            api.auth.apply_auth(url, self.method, headers, {})
+        timeout = api.timeout
+        if deadline is not None:
+            timeout = deadline.timeout(timeout)
+        self.started = time.time()
+        self.rpc = urlfetch.create_rpc(deadline=timeout)
+        urlfetch.make_fetch_call(self.rpc, url, payload='',
+                                 method=self.method, headers=headers)
+
+    def finish(self):
+        try:
+            result = self.rpc.get_result()
+        except urlfetch.Error, e:
+            self.error = tweepy.TweepError('Failed to send request: %s' % e)
+        else:
+            if result.status_code == 200:
+                self.result = result.content
+            else:
+                try:
+                    reason = self.api.parser.parse_error(result.content)
+                except Exception:
+                    reason = ("Twitter error response: status code = %s"
+                              % result.status_code)
+                self.error = tweepy.TweepError(reason, Response(result))
+        self.latency = time.time() - self.started
+
+
+class Dispatcher(object):
+    """Send Twitter API calls concurrently through asynchronous urlfetch.
+
+    Calls go out in waves of up to size requests, each wave waited for
+    before the next starts. A wave takes the next calls of every key in
+    turn, at most width of each, so a key's calls go out in the order they
+    were added, width at a time. Keys left out of a wave come first in the
+    next one.
+    """
+
+    def __init__(self, width=4, size=10):
+        self.width = width
+        self.size = size
+        self.keys = []
+        self.calls = {}
+
+    def add(self, key, api, method, path, context=None):
+        if key not in self.calls:
+            self.keys.append(key)
+            self.calls[key] = []
+        call = Call(key, api, method, path, context)
+        self.calls[key].append(call)
+        return call
+
+    def _next_wave(self, order, queues):
+        wave = []
+        taken = dict.fromkeys(order, 0)
+        more = True
+        while more and len(wave) < self.size:
+            more = False
+            for key in order:
+                if (queues[key] and taken[key] < self.width
+                        and len(wave) < self.size):
+                    wave.append(queues[key].pop(0))
+                    taken[key] += 1
+                    more = True
+        order.sort(key=lambda k: taken[k] > 0)
+        return wave
+
+    def waves(self, deadline=None):
+        """Send the calls and yield each wave once it finished.
+
+        No wave is started once the deadline expired, the calls left are
+        never sent and have no latency.
+        """
+        order = list(self.keys)
+        queues = dict([(key, list(self.calls[key])) for key in self.keys])
+        while deadline is None or not deadline.expired():
+            wave = self._next_wave(order, queues)
+            if not wave:
+                return
+            for call in wave:
+                try:
+                    call.start(deadline)
+                except tweepy.DeadlineExceeded, e:
+                    call.error = e
+            for call in wave:
+                if call.rpc is not None:
+                    call.finish()
+            yield wave
+
+    def all_calls(self):
+        """Return every call, in the order they were added per key."""
+        calls = []
+        for key in self.keys:
+            calls.extend(self.calls[key])
+        return calls
+
+
+def summarize(calls):
+    """Return (count, failures, median latency, max latency) of calls."""
+    latencies = sorted([c.latency for c in calls if c.latency is not None])
+    failures = len([c for c in calls if c.error is not None])
+    if not latencies:
+        return len(calls), failures, 0.0, 0.0
+    return (len(calls), failures, latencies[len(latencies) // 2],
+            latencies[-1])
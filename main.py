@@ -24,11 +24,16 @@
 # OTHER DEALINGS IN THE SOFTWARE.
 
 
+from google.appengine.ext import db
+from google.appengine.api import memcache
 from google.appengine.ext import webapp
 from google.appengine.ext.webapp import util
 import os
-import re
+import cgi
+import time
+import urllib
 import logging
+from datetime import datetime
 from google.appengine.ext.webapp import template
 from google.appengine.api.labs import taskqueue
 import tweepy
@@ -36,28 +41,78 @@ from tweepy import Cursor
 from configs import CONSUMER_KEY, CONSUMER_SECRET, CALLBACK
 from models import OAuthToken, User, Criterion
 from utils import Cookies
+from matcher import Matcher, UnsafeTerm, check_term
+import session
+import collector
+import scheduler
+import outbox
 
 
 COOKIE_LIFE = 7 * 24 * 60 * 60 # 1 week
+TRIGGER_BATCH = 500 # criteria scanned per /trigger request
+MAX_TASKS_PER_ADD = 100 # tasks the task queue accepts in one batch
+LISTS_LIFE = 60 * 60 # seconds the lists of a user stay in memcache
+PREVIEW_PAGE = 20 # tweets scanned per preview request
+PREVIEW_TWEETS = 100 # tweets of a list scanned by a whole preview
+PREVIEW_LIFE = 5 * 60 # seconds a previewed timeline stays in memcache
+PREVIEW_MATCHES = 10 # matches shown by a whole preview
 
 
 def get_user_status(cookies):
-    user = None
+    user = session.get_user(cookies)
     screen_name = None
 
-    if "ulg" in cookies and "auau" in cookies:
-        token_key = cookies["ulg"]
-        token_secret = cookies["auau"]
-
-        user = User.gql("WHERE token_key=:key AND token_secret=:secret",
-                        key=token_key, secret=token_secret).get()
-
     if user:
         screen_name = user.screen_name
 
     return user, screen_name
 
 
+def get_lists(user, refresh=False):
+    """Return the lists of the user, as dicts of id, slug and full_name.
+
+    Only these three fields are kept in memcache, pass refresh to fetch
+    them from Twitter again.
+    """
+    key = "lists:%s" % user.key()
+    lists = None
+    if not refresh:
+        lists = memcache.get(key)
+    if lists is None:
+        api = collector.get_api(user)
+        lists = [(l.id, l.slug, l.full_name)
+                 for l in Cursor(api.lists).items()]
+        memcache.set(key, lists, time=LISTS_LIFE)
+
+    return [{'id': id, 'slug': slug, 'full_name': full_name}
+            for id, slug, full_name in lists]
+
+
+def get_recent_tweets(user, list_id, count):
+    """Return the newest tweets of the list, as (id, screen_name, text).
+
+    The tweets are kept in memcache for a while and only fetched from
+    Twitter as far as count asks for, so previewing the same list again
+    costs nothing. Returns fewer than count if the list has no more.
+    """
+    key = "preview:%s:%d" % (user.key(), list_id)
+    tweets, complete = memcache.get(key) or ([], False)
+    if len(tweets) >= count or complete:
+        return tweets
+
+    api = collector.get_api(user)
+    while len(tweets) < count and not complete:
+        kargs = {}
+        if tweets:
+            kargs['max_id'] = tweets[-1][0] - 1
+        page = api.list_timeline(owner=user.screen_name, slug=list_id,
+                                 per_page=PREVIEW_PAGE, **kargs)
+        tweets.extend([(s.id, s.user.screen_name, s.text) for s in page])
+        complete = len(page) < PREVIEW_PAGE
+    memcache.set(key, (tweets, complete), time=PREVIEW_LIFE)
+    return tweets
+
+
 class MainHandler(webapp.RequestHandler):
     def get(self):
         cookies = Cookies(self, max_age = COOKIE_LIFE)
@@ -105,23 +160,32 @@ class CallbackHandler(webapp.RequestHandler):
             self.response.out.write(template.render(path, msg))
             return
 
-        # remember on the user browser
-        cookies = Cookies(self, max_age = COOKIE_LIFE)
-        token_key = cookies["ulg"] = auth.access_token.key
-        token_secret = cookies["auau"] = auth.access_token.secret
+        token_key = auth.access_token.key
+        token_secret = auth.access_token.secret
 
         # save to datastore if not already
-        user = User.gql("WHERE token_key=:key AND token_secret=:secret",
-                        key=token_key, secret=token_secret).get()
+        user = session.get_user_by_token(token_key, token_secret)
         if user is None:
             api = tweepy.API(auth)
             twitter_user = api.me()
-            user = User(
-                screen_name = twitter_user.screen_name,
-                token_key = auth.access_token.key,
-                token_secret = auth.access_token.secret
-                )
+            user = User.gql("WHERE screen_name=:name",
+                            name=twitter_user.screen_name).get()
+            if user is not None:
+                # the user authorized us again and got a new token
+                user.token_key = token_key
+                user.token_secret = token_secret
+            else:
+                user = User(
+                    screen_name = twitter_user.screen_name,
+                    token_key = auth.access_token.key,
+                    token_secret = auth.access_token.secret
+                    )
             user.put()
+            session.cache_user(user)
+
+        # remember on the user browser
+        cookies = Cookies(self, max_age = COOKIE_LIFE)
+        session.start(cookies, user)
 
         self.redirect("/manage")
 
@@ -129,20 +193,9 @@ class CallbackHandler(webapp.RequestHandler):
 class SignInHandler(webapp.RequestHandler):
     def get(self):
         cookies = Cookies(self, max_age = COOKIE_LIFE)
-        token_key = None
-        token_secret = None
-
-        if "ulg" in cookies:
-            token_key = cookies["ulg"]
-        if "auau" in cookies:
-            token_secret = cookies["auau"]
-
-        if token_key is not None and token_secret is not None:
-            user = User.gql("WHERE token_key=:key AND token_secret=:secret",
-                            key=token_key, secret=token_secret).get()
-            if user is not None:
-                self.redirect("/manage")
-                return
+        if session.get_user(cookies) is not None:
+            self.redirect("/manage")
+            return
 
         # OAuth dance
         auth = tweepy.OAuthHandler(CONSUMER_KEY, CONSUMER_SECRET, CALLBACK)
@@ -174,8 +227,7 @@ class SignInHandler(webapp.RequestHandler):
 class SignOutHandler(webapp.RequestHandler):
     def get(self):
         cookies = Cookies(self, max_age = COOKIE_LIFE)
-        del cookies["ulg"]
-        del cookies["auau"]
+        session.end(cookies)
 
         self.redirect("/")
 
@@ -190,13 +242,8 @@ class ManageHandler(webapp.RequestHandler):
         user, screen_name = get_user_status(cookies)
 
         if user:
-            auth = tweepy.OAuthHandler(CONSUMER_KEY, CONSUMER_SECRET)
-            auth.set_access_token(user.token_key, user.token_secret)
-            api = tweepy.API(auth)
-
             try:
-                for l in Cursor(api.lists).items():
-                    lists.append(l)
+                lists = get_lists(user, self.request.get("refresh") == "1")
             except tweepy.TweepError, e:
                 logging.error(e)
 
@@ -233,38 +280,46 @@ class PreviewHandler(webapp.RequestHandler):
         # convert list_id from string to long
         try:
             list_id = long(list_id) # long
+            page = int(self.request.get("page", "0"))
+            # matches the page still has room for
+            limit = int(self.request.get("limit", str(PREVIEW_MATCHES)))
+            limit = max(0, min(limit, PREVIEW_MATCHES))
         except:
             self.error(400)
             return
 
-        auth = tweepy.OAuthHandler(CONSUMER_KEY, CONSUMER_SECRET)
-        auth.set_access_token(user.token_key, user.token_secret)
-        api = tweepy.API(auth)
-
-        prog = re.compile(term, re.IGNORECASE)
-        total_count = 100
-        effective_count = 10
-        result = []
+        try:
+            term = check_term(term)
+        except UnsafeTerm, e:
+            self.error(400)
+            self.response.out.write(str(e))
+            return
 
+        # each request scans one page, the page polls for the next one
+        start = page * PREVIEW_PAGE
+        end = min(start + PREVIEW_PAGE, PREVIEW_TWEETS)
         try:
-            for status in Cursor(api.list_timeline, owner=user.screen_name, slug=list_id).items():
-                if prog.search(status.text):
-                    result.append("<pre>")
-                    result.append(status.user.screen_name)
-                    result.append(": ")
-                    result.append(status.text)
-                    result.append("</pre>")
-                    effective_count -= 1
-
-                total_count -= 1
-
-                if effective_count <= 0 or total_count <= 0:
-                    # enough for preview?
-                    break
+            tweets = get_recent_tweets(user, list_id, end)
         except tweepy.TweepError, e:
             self.error(503)
             return
 
+        matcher = Matcher([term])
+        result = []
+        found = 0
+        for tweet_id, screen_name, text in tweets[start:end]:
+            if found >= limit:
+                break
+            if matcher.search(text):
+                result.append("<pre>")
+                result.append(cgi.escape(screen_name))
+                result.append(": ")
+                result.append(cgi.escape(text))
+                result.append("</pre>")
+                found += 1
+
+        if found < limit and len(tweets) >= end and end < PREVIEW_TWEETS:
+            self.response.headers['X-Next-Page'] = str(page + 1)
         self.response.out.write("".join(result))
 
 
@@ -299,6 +354,14 @@ class SaveHandler(webapp.RequestHandler):
             self.error(400)
             return
 
+        # reject terms that could stall collection for everyone
+        try:
+            term = check_term(term)
+        except UnsafeTerm, e:
+            self.error(400)
+            self.response.out.write(str(e))
+            return
+
         # create or update criterion
         c = Criterion.gql("WHERE screen_name=:name",
                           name=user.screen_name).get()
@@ -310,83 +373,134 @@ class SaveHandler(webapp.RequestHandler):
                 screen_name = user.screen_name,
                 term = term,
                 list_id = list_id)
+        scheduler.make_due(c)
         c.put()
 
 
 class TriggerHandler(webapp.RequestHandler):
+    """Enqueue the due criteria, TRIGGER_BATCH of them per request.
+
+    Only criteria whose next_due passed are queried. Cron starts a scan
+    with a GET, every batch then continues the scan from its datastore
+    cursor in a POSTed task, so a request never walks more than one batch
+    however many criteria exist.
+    """
+
     def get(self):
-        for c in Criterion.all():
-            params = {
-                "screen_name": c.screen_name,
-                "term": c.term,
-                "list_id": c.list_id,
-                }
-            taskqueue.add(url = "/collect", params = params)
+        self.trigger(int(time.time()), 0, None)
+
+    def post(self):
+        try:
+            cycle = int(self.request.get("cycle"))
+            batch = int(self.request.get("batch"))
+        except ValueError:
+            logging.error("Invalid trigger continuation.")
+            return
+        self.trigger(cycle, batch, self.request.get("cursor"))
+
+    def trigger(self, cycle, batch, cursor):
+        # every batch of the scan runs the same query, as of its start
+        q = Criterion.all()
+        q.filter("next_due <=", datetime.utcfromtimestamp(cycle))
+        if cursor:
+            q.with_cursor(cursor)
+        due = q.fetch(TRIGGER_BATCH)
+
+        tasks = []
+        for i in range(0, len(due), collector.SHARD_SIZE):
+            ids = [c.key().id() for c in due[i:i + collector.SHARD_SIZE]]
+            params = {"ids": ",".join([str(id) for id in ids])}
+            tasks.append(taskqueue.Task(url = "/collect", params = params))
+        shards = len(tasks)
+        payload_bytes = sum([len(t.payload) for t in tasks])
+
+        queue = taskqueue.Queue(collector.COLLECT_QUEUE)
+        rpcs = 0
+        for i in range(0, len(tasks), MAX_TASKS_PER_ADD):
+            rpcs += 1
+            queue.add(tasks[i:i + MAX_TASKS_PER_ADD])
+
+        # the continuation is named, so a retried request can not fork
+        # the scan into two.
+        if len(due) == TRIGGER_BATCH:
+            params = {"cycle": cycle, "batch": batch + 1, "cursor": q.cursor()}
+            try:
+                taskqueue.add(url = "/trigger", params = params,
+                              name = "trigger-%d-%d" % (cycle, batch + 1))
+            except (taskqueue.TaskAlreadyExistsError,
+                    taskqueue.TombstonedTaskError):
+                logging.warning("Trigger batch %d of cycle %d already "
+                                "continued.", batch, cycle)
+
+        logging.info("Trigger batch %d of cycle %d: enqueued %d collection "
+                     "shards for %d due criteria.", batch, cycle,
+                     shards, len(due))
+
+        # compared to one task per criterion carrying all its fields
+        legacy_bytes = sum([len(urllib.urlencode({
+                        "screen_name": c.screen_name.encode("utf-8"),
+                        "term": c.term.encode("utf-8"),
+                        "list_id": c.list_id})) for c in due])
+        logging.info("Saved %d payload bytes and %d enqueue RPCs.",
+                     legacy_bytes - payload_bytes, len(due) - rpcs)
 
 
 class CollectHandler(webapp.RequestHandler):
     def post(self):
-        screen_name = self.request.get("screen_name")
-        term = self.request.get("term")
-        list_id = self.request.get("list_id")
-
-        # convert list_id from string to long
         try:
-            list_id = long(list_id) # long
-        except:
-            logging.error("Could not convert data to an integer.")
+            ids = [int(id) for id in self.request.get("ids").split(",")]
+        except ValueError:
+            logging.error("No criteria to collect.")
             return
 
-        u = User.gql("WHERE screen_name = :name", name = screen_name).get()
-        if u is None:
-            logging.error("Could not find screen name: %s.", screen_name)
-            return
-        since_id = u.since_id
-        token_key = u.token_key
-        token_secret = u.token_secret
+        keys = [db.Key.from_path("Criterion", id) for id in ids]
+        queue_name = self.request.headers.get("X-AppEngine-QueueName")
+        collector.collect_shard(keys, queue_name)
 
-        # prepare Twitter API.
-        auth = tweepy.OAuthHandler(CONSUMER_KEY, CONSUMER_SECRET)
-        auth.set_access_token(token_key, token_secret)
-        api = tweepy.API(auth)
 
-        # if it's the first time this user is using this service,
-        # check all the existing tweets.
-        existing_retweets = set()
-        if since_id is None:
-            try:
-                for t in Cursor(api.retweeted_by_me).items():
-                    existing_retweets.add(t.retweeted_status.id)
-            except tweepy.TweepError, e:
-                logging.error(e)
-                return
+class MigrateHandler(webapp.RequestHandler):
+    """Make criteria saved without a due time due, TRIGGER_BATCH at a time.
 
-        # collect tweets to retweet
-        prog = re.compile(term, re.IGNORECASE)
-        max_id = 1
-        tweet_ids = []
-        try:
-            for t in Cursor(api.list_timeline, owner=screen_name, slug=list_id, since_id=since_id or 1).items():
-                if prog.search(t.text) and (t.id not in existing_retweets):
-                    tweet_ids.insert(0, t.id) # old tweets are retweeted first
-                # keep max tweet id as the next since_id
-                if max_id < t.id:
-                    max_id = t.id
-        except tweepy.TweepError, e:
-            logging.error(e)
-            return
+    /trigger only finds criteria by next_due, run this once after
+    deploying it. Batches continue from their cursor like /trigger.
+    """
 
-        # retweet
-        for i in tweet_ids:
-            try:
-                api.retweet(i)
-            except tweepy.TweepError, e:
-                pass
+    def get(self):
+        self.migrate(None)
+
+    def post(self):
+        self.migrate(self.request.get("cursor"))
+
+    def migrate(self, cursor):
+        q = Criterion.all()
+        if cursor:
+            q.with_cursor(cursor)
+        criteria = q.fetch(TRIGGER_BATCH)
+
+        now = datetime.utcnow()
+        changed = [c for c in criteria if c.next_due is None]
+        for c in changed:
+            scheduler.make_due(c, now)
+        if changed:
+            db.put(changed)
+
+        if len(criteria) == TRIGGER_BATCH:
+            taskqueue.add(url = "/migrate", params = {"cursor": q.cursor()})
+        logging.info("Made %d of %d criteria due.", len(changed),
+                     len(criteria))
+
+
+class RetweetHandler(webapp.RequestHandler):
+    def post(self):
+        deadline = tweepy.Deadline(outbox.RETWEET_DEADLINE)
+        screen_names = self.request.get_all("screen_name")
+        users = collector.get_users(screen_names)
+        for screen_name in screen_names:
+            if screen_name not in users:
+                logging.error("Could not find screen name: %s.", screen_name)
 
-        # update since_id
-        if u.since_id < max_id:
-            u.since_id = max_id
-            u.put()
+        apis = dict([(name, collector.get_api(u)) for name, u in users.items()])
+        outbox.drain(apis, deadline)
 
 
 def main():
@@ -400,6 +514,8 @@ def main():
         ('/save', SaveHandler),
         ('/trigger', TriggerHandler),
         ('/collect', CollectHandler),
+        ('/retweet', RetweetHandler),
+        ('/migrate', MigrateHandler),
         ]
     application = webapp.WSGIApplication(actions, debug=True)
     util.run_wsgi_app(application)
@@ -0,0 +1,423 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2010 Ron Huang
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+
+import re
+import time
+import logging
+import sre_parse
+import sre_compile
+
+
+CACHE_SIZE = 256 # compiled patterns kept per process
+KEYWORD_THRESHOLD = 8 # literal terms scanned with Aho-Corasick from here on
+
+REGEX_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+MAX_TERM_LENGTH = 200
+MAX_REPEAT_PRODUCT = 1000 # nested bounded repeats may multiply up to this
+
+REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+SINGLE_CHARS = (sre_parse.LITERAL, sre_parse.NOT_LITERAL, sre_parse.ANY,
+                sre_parse.IN)
+# characters tried to tell whether two repeats can match the same text
+SAMPLE_CHARS = frozenset([unichr(i) for i in range(0x250)])
+
+
+class UnsafeTerm(ValueError):
+    """The search term is invalid or too expensive to match."""
+    pass
+
+
+class LRUCache(object):
+    """A small least recently used cache."""
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = {}
+        self.tick = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.tick += 1
+        entry[0] = self.tick
+        return entry[1]
+
+    def store(self, key, value):
+        if key not in self.entries and len(self.entries) >= self.size:
+            oldest = min(self.entries.items(), key=lambda i: i[1][0])[0]
+            del self.entries[oldest]
+        self.tick += 1
+        self.entries[key] = [self.tick, value]
+
+
+_compiled = LRUCache(CACHE_SIZE)
+
+
+def compile_term(term):
+    """Compile a search term, reusing the compiled pattern if possible."""
+    prog = _compiled.get(term)
+    if prog is None:
+        prog = re.compile(term, re.IGNORECASE)
+        _compiled.store(term, prog)
+    return prog
+
+
+def is_literal(term):
+    """Return True if the term has no regular expression syntax."""
+    for ch in term:
+        if ch in REGEX_CHARS:
+            return False
+    return True
+
+
+def is_combinable(term):
+    """Return True if the term can be part of an alternation.
+
+    Group references and inline flags depend on the term being the whole
+    pattern, so such terms are always searched on their own.
+    """
+    return '(?' not in term and re.search(r'\\[1-9]', term) is None
+
+
+def _subpatterns(av):
+    if isinstance(av, sre_parse.SubPattern):
+        return [av]
+    result = []
+    if isinstance(av, (tuple, list)):
+        for item in av:
+            result.extend(_subpatterns(item))
+    return result
+
+
+def _flatten(pattern):
+    # the items of a sequence, with the items of its groups inlined
+    items = []
+    for op, av in pattern:
+        if op == sre_parse.SUBPATTERN:
+            items.extend(_flatten(av[1]))
+        else:
+            items.append((op, av))
+    return items
+
+
+def _charset(items):
+    """Return the sample characters the single character items match.
+
+    Items of any other kind may match anything.
+    """
+    chars = set()
+    for item in items:
+        if item[0] not in SINGLE_CHARS:
+            return SAMPLE_CHARS
+        pattern = sre_parse.SubPattern(sre_parse.Pattern(), [item])
+        prog = sre_compile.compile(pattern, re.IGNORECASE)
+        chars.update([ch for ch in SAMPLE_CHARS if prog.match(ch)])
+    return frozenset(chars)
+
+
+def _check_sequence(pattern):
+    """Reject unbounded repeats that can split the same text many ways.
+
+    Like \\w*\\w* or .*.*, each one multiplies the ways a failing search
+    is tried. A repeat is left behind once an item it can not match must
+    follow it, as in \\w+ .*.
+    """
+    pending = []
+    for op, av in _flatten(pattern):
+        if op in REPEATS:
+            lo, hi, item = av
+            chars = _charset(_flatten(item))
+            if lo > 0:
+                # at least one of its characters must follow
+                pending = [other for other in pending if chars & other]
+            if hi != sre_parse.MAXREPEAT:
+                continue
+            for other in pending:
+                if chars & other:
+                    raise UnsafeTerm("Overlapping repetitions are not allowed.")
+            pending.append(chars)
+        elif op in SINGLE_CHARS:
+            chars = _charset([(op, av)])
+            pending = [other for other in pending if chars & other]
+
+
+def _check_repeats(pattern, outer_hi):
+    """Reject repeats nested inside repeats that may backtrack badly.
+
+    outer_hi is the product of the maximum counts of the enclosing repeats.
+    """
+    _check_sequence(pattern)
+    for op, av in pattern:
+        if op in REPEATS:
+            lo, hi, item = av
+            if outer_hi > 1 and hi > 1 and (
+                    hi == sre_parse.MAXREPEAT or
+                    outer_hi == sre_parse.MAXREPEAT or
+                    outer_hi * hi > MAX_REPEAT_PRODUCT):
+                raise UnsafeTerm("Nested repetition is not allowed.")
+            if hi == sre_parse.MAXREPEAT or outer_hi == sre_parse.MAXREPEAT:
+                inner_hi = sre_parse.MAXREPEAT
+            else:
+                inner_hi = max(outer_hi, 1) * hi
+            _check_repeats(item, inner_hi)
+        else:
+            if op == sre_parse.BRANCH and outer_hi > 1:
+                raise UnsafeTerm("Alternation inside repetition is not allowed.")
+            for sub in _subpatterns(av):
+                _check_repeats(sub, outer_hi)
+
+
+def _is_escaped(term, index):
+    backslashes = 0
+    while index > 0 and term[index - 1] == '\\':
+        backslashes += 1
+        index -= 1
+    return backslashes % 2 == 1
+
+
+def _strip_wildcards(term):
+    """Drop leading and trailing .* which never change a search result."""
+    for prefix in ('.*?', '.*'):
+        if term.startswith(prefix) and len(term) > len(prefix):
+            term = term[len(prefix):]
+            break
+    for suffix in ('.*?', '.*'):
+        dot = len(term) - len(suffix)
+        if term.endswith(suffix) and dot > 0 and \
+                not _is_escaped(term, dot) and term[dot - 1] not in '*+?{':
+            term = term[:dot]
+            break
+    return term
+
+
+def check_term(term):
+    """Return the term rewritten for matching, or raise UnsafeTerm.
+
+    Terms that do not compile, are too long, nest repetitions or
+    alternations in repetitions, or chain unbounded repetitions of
+    overlapping characters, in ways that can backtrack catastrophically,
+    are rejected.
+    """
+    if len(term) > MAX_TERM_LENGTH:
+        raise UnsafeTerm("Term is longer than %d characters." % MAX_TERM_LENGTH)
+    term = _strip_wildcards(term)
+    try:
+        pattern = sre_parse.parse(term, re.IGNORECASE)
+    except (re.error, RuntimeError, OverflowError), e:
+        raise UnsafeTerm("Invalid term: %s." % e)
+    _check_repeats(pattern, 1)
+    return term
+
+
+def is_safe(term):
+    try:
+        check_term(term)
+    except UnsafeTerm:
+        return False
+    return True
+
+
+class KeywordMatcher(object):
+    """Aho-Corasick automaton finding many keywords in one scan."""
+
+    def __init__(self, keywords):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [set()]
+
+        for index, keyword in enumerate(keywords):
+            state = 0
+            for ch in keyword.lower():
+                if ch not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(set())
+                    self.goto[state][ch] = len(self.goto) - 1
+                state = self.goto[state][ch]
+            self.out[state].add(index)
+
+        # breadth first, so the failure state is always built first.
+        queue = list(self.goto[0].values())
+        while queue:
+            state = queue.pop(0)
+            for ch, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(ch, 0)
+                self.out[child] |= self.out[self.fail[child]]
+
+    def find(self, text):
+        """Return the indexes of the keywords found in text."""
+        found = set()
+        state = 0
+        goto = self.goto
+        fail = self.fail
+        out = self.out
+        for ch in text.lower():
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+
+class Matcher(object):
+    """Match texts against many search terms.
+
+    Literal terms are matched as case-insensitive substrings, through an
+    Aho-Corasick automaton when there are many of them. The other safe
+    terms are combined into one alternation, so a text that matches none
+    of them is scanned once however many terms there are. Terms that fail
+    check_term, typically saved before it existed, never match.
+
+    Matching time of the terms searched on their own is accounted per term
+    in elapsed, the time of a literal scan being split between the
+    literals. The time of the combined alternation is accounted in
+    combined_elapsed; once it used up budget seconds, the alternation is
+    dropped and its terms are searched one by one. Any regular expression
+    term stops matching once it used up budget seconds on its own.
+    """
+
+    def __init__(self, terms, budget=None):
+        self.terms = list(terms)
+        self.budget = budget
+        self.elapsed = [0.0] * len(self.terms)
+        self.combined_elapsed = 0.0
+        self.disabled = set()
+        self.literals = []
+        self.regexes = []
+        self.standalone = []
+
+        for index, term in enumerate(self.terms):
+            try:
+                check_term(term)
+            except UnsafeTerm, e:
+                logging.warning("Skipping term %r: %s", term, e)
+                continue
+            if is_literal(term):
+                self.literals.append(index)
+            elif is_combinable(term):
+                self.regexes.append(index)
+            else:
+                self.standalone.append(index)
+
+        self.keywords = None
+        if len(self.literals) >= KEYWORD_THRESHOLD:
+            self.keywords = KeywordMatcher(
+                [self.terms[i] for i in self.literals])
+
+        self.combined = None
+        if len(self.regexes) > 1:
+            pattern = '|'.join(['(?:%s)' % self.terms[i]
+                                for i in self.regexes])
+            try:
+                self.combined = compile_term(pattern)
+            except (re.error, AssertionError, RuntimeError, OverflowError), e:
+                # e.g. more groups than the re module supports
+                logging.warning("Could not combine %d terms, searching them "
+                                "one by one: %s", len(self.regexes), e)
+
+    def _charge(self, indexes, started):
+        share = (time.clock() - started) / len(indexes)
+        for i in indexes:
+            self.elapsed[i] += share
+
+    def _match_literals(self, text):
+        started = time.clock()
+        if self.keywords is not None:
+            found = set([self.literals[i] for i in self.keywords.find(text)])
+        else:
+            text = text.lower()
+            found = set([i for i in self.literals
+                         if self.terms[i].lower() in text])
+        self._charge(self.literals, started)
+        return found
+
+    def _search_term(self, i, text):
+        started = time.clock()
+        found = compile_term(self.terms[i]).search(text) is not None
+        self.elapsed[i] += time.clock() - started
+        return found
+
+    def _search_budgeted(self, i, text):
+        if i in self.disabled:
+            return False
+        found = self._search_term(i, text)
+        if self.budget is not None and self.elapsed[i] > self.budget:
+            logging.warning("Term %r used up its %.2fs budget.",
+                            self.terms[i], self.budget)
+            self.disabled.add(i)
+        return found
+
+    def _search_combined(self, text):
+        started = time.clock()
+        found = self.combined.search(text) is not None
+        self.combined_elapsed += time.clock() - started
+        if self.budget is not None and self.combined_elapsed > self.budget:
+            logging.warning("Combined terms used up their %.2fs budget, "
+                            "searching them one by one.", self.budget)
+            self.combined = None
+        return found
+
+    def _match_regexes(self, text):
+        if self.combined is not None and not self._search_combined(text):
+            return set()
+        return set([i for i in self.regexes
+                    if self._search_budgeted(i, text)])
+
+    def matches(self, text):
+        """Return the indexes of the terms matching text."""
+        found = set()
+        if self.literals:
+            found = self._match_literals(text)
+        if self.regexes:
+            found |= self._match_regexes(text)
+        for i in self.standalone:
+            if self._search_budgeted(i, text):
+                found.add(i)
+        return found
+
+    def search(self, text):
+        """Return True if any term matches text."""
+        if self.literals and self._match_literals(text):
+            return True
+        if self.combined is not None:
+            if self._search_combined(text):
+                return True
+        else:
+            for i in self.regexes:
+                if self._search_budgeted(i, text):
+                    return True
+        for i in self.standalone:
+            if self._search_budgeted(i, text):
+                return True
+        return False
@@ -24,6 +24,7 @@
 # OTHER DEALINGS IN THE SOFTWARE.
 
 
+import struct
 from google.appengine.ext import db
 
 
@@ -37,6 +38,7 @@ class User(db.Model):
     screen_name = db.StringProperty(required=True)
     token_key = db.StringProperty(required=True)
     token_secret = db.StringProperty(required=True)
+    # collection progress of before it was kept per list, see Watermark
     since_id = db.IntegerProperty()
 
 
@@ -44,3 +46,93 @@ class Criterion(db.Model):
     screen_name = db.StringProperty(required=True)
     term = db.StringProperty(required=True)
     list_id = db.IntegerProperty(required=True)
+    match_time = db.FloatProperty(default=0.0) # CPU seconds in last run
+    next_due = db.DateTimeProperty()
+    interval = db.IntegerProperty() # minutes between runs
+    last_tweets = db.IntegerProperty(default=0) # new tweets in last run
+    last_matches = db.IntegerProperty(default=0) # matches in last run
+
+
+class Watermark(db.Model):
+    """How far a list timeline was collected for a user.
+
+    A child of the user, keyed by list id. Tweets up to since_id were
+    collected. While a backlog is walked backward, max_id is where the
+    next run resumes and top_id the newest tweet seen meanwhile.
+    """
+    since_id = db.IntegerProperty()
+    max_id = db.IntegerProperty()
+    top_id = db.IntegerProperty()
+    leased_until = db.DateTimeProperty()
+
+    @staticmethod
+    def key_name_for(list_id):
+        return "list:%d" % list_id
+
+
+class Session(db.Model):
+    """A signed in browser.
+
+    A child of the user, keyed by a random id. The session cookie holds
+    the user id and that random id, so both are fetched by key at once.
+    """
+    created_at = db.DateTimeProperty(required=True, auto_now_add=True)
+
+
+class OutboxItem(db.Model):
+    """A matched tweet waiting to be retweeted for a user.
+
+    The key name is built from the screen name and the tweet id, so
+    queuing the same tweet twice never creates a second item.
+    """
+    screen_name = db.StringProperty(required=True)
+    tweet_id = db.IntegerProperty(required=True)
+    done = db.BooleanProperty(required=True, default=False)
+    attempts = db.IntegerProperty(required=True, default=0)
+    created_at = db.DateTimeProperty(required=True, auto_now_add=True)
+
+    @staticmethod
+    def key_name_for(screen_name, tweet_id):
+        return "%s:%d" % (screen_name, tweet_id)
+
+
+class RetweetIndex(db.Model):
+    """Ids of the tweets a user retweeted, keyed by screen name.
+
+    The ids are kept sorted and packed as big-endian int64 values, so a
+    lookup is a binary search on the blob without unpacking it. Only the
+    newest MAX_IDS ids are kept, older ones are behind since_id anyway.
+    """
+    ids = db.BlobProperty(default='')
+    # while the index is first built, older retweets are still to be
+    # fetched from below max_id
+    complete = db.BooleanProperty(default=True)
+    max_id = db.IntegerProperty()
+
+    ID_FORMAT = '>q'
+    ID_SIZE = struct.calcsize(ID_FORMAT)
+    MAX_IDS = 100000 # 800KB, below the 1MB entity limit
+
+    def __len__(self):
+        return len(self.ids) // self.ID_SIZE
+
+    def _id_at(self, index):
+        return struct.unpack_from(self.ID_FORMAT, self.ids,
+                                  index * self.ID_SIZE)[0]
+
+    def __contains__(self, tweet_id):
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._id_at(mid) < tweet_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo < len(self) and self._id_at(lo) == tweet_id
+
+    def add(self, tweet_ids):
+        count = len(self)
+        merged = set(struct.unpack('>%dq' % count, self.ids))
+        merged.update(tweet_ids)
+        merged = sorted(merged)[-self.MAX_IDS:]
+        self.ids = db.Blob(struct.pack('>%dq' % len(merged), *merged))
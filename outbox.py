@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2010 Ron Huang
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+
+import time
+import logging
+from google.appengine.ext import db
+from google.appengine.api.labs import taskqueue
+import tweepy
+from models import OutboxItem, RetweetIndex
+from dispatch import Dispatcher, summarize
+import watermark
+
+
+DRAIN_LIMIT = 100 # items per user retweeted by one /retweet task
+MAX_ATTEMPTS = 3 # transient failures before an item is given up
+RETRY_DELAY = 5 * 60 # seconds before retrying transient failures
+RETWEET_QUEUE = 'retweet' # see queue.yaml
+RETWEET_WIDTH = 4 # retweets of a user sent at once, oldest first
+RETWEET_WAVE = 10 # retweets sent at once, the most urlfetch allows
+RETWEET_DEADLINE = watermark.TASK_DEADLINE - 10 # seconds a task may send
+
+
+def enqueue(screen_name, tweet_ids):
+    """Store the tweets to retweet for the user, skipping known ones.
+
+    Returns the number of new items.
+    """
+    if not tweet_ids:
+        return 0
+    keys = [db.Key.from_path('OutboxItem',
+                             OutboxItem.key_name_for(screen_name, i))
+            for i in tweet_ids]
+    items = []
+    for key, existing, tweet_id in zip(keys, db.get(keys), tweet_ids):
+        if existing is None:
+            items.append(OutboxItem(key_name=key.name(),
+                                    screen_name=screen_name,
+                                    tweet_id=tweet_id))
+    if items:
+        db.put(items)
+    return len(items)
+
+
+def schedule(screen_names, countdown=0):
+    """Start draining the outboxes of the users."""
+    if screen_names:
+        taskqueue.add(url = "/retweet", params = {"screen_name": screen_names},
+                      countdown = countdown, queue_name = RETWEET_QUEUE)
+
+
+def pending(screen_name, limit=DRAIN_LIMIT):
+    """Return the user's items not retweeted yet, oldest first."""
+    q = OutboxItem.all()
+    q.filter("screen_name =", screen_name)
+    q.filter("done =", False)
+    q.order("tweet_id")
+    return q.fetch(limit)
+
+
+def is_permanent(e):
+    """Return True if retrying the retweet can not succeed."""
+    status = getattr(e.response, 'status', None)
+    return status is not None and 400 <= status < 500
+
+
+def settle(item, error):
+    """Mark the sent item done, unless its retweet failed transiently."""
+    item.attempts += 1
+    if error is None or is_permanent(error) or item.attempts >= MAX_ATTEMPTS:
+        item.done = True
+
+
+def record(screen_name, tweet_ids):
+    """Add the retweeted tweets to the user's retweet index."""
+    def txn():
+        index = RetweetIndex.get_by_key_name(screen_name)
+        # the collector builds the index before queuing anything, one
+        # created here would miss the older retweets.
+        if index is not None:
+            index.add(tweet_ids)
+            index.put()
+    db.run_in_transaction(txn)
+
+
+def drain(users, deadline=None):
+    """Retweet the pending items of the users, oldest first per user.
+
+    The retweets are sent concurrently, in waves of RETWEET_WAVE taking up
+    to RETWEET_WIDTH items of each user, and the items of a wave are saved
+    once it finished.
+
+    users maps screen names to their API. Users with items left over are
+    drained again by a new task, right away if the task hit DRAIN_LIMIT
+    or the deadline, and after RETRY_DELAY if retweets failed transiently.
+    """
+    started = time.time()
+    if deadline is None:
+        deadline = tweepy.Deadline(RETWEET_DEADLINE)
+    dispatcher = Dispatcher(RETWEET_WIDTH, RETWEET_WAVE)
+    again = []
+    retry = set()
+    for screen_name, api in users.items():
+        items = pending(screen_name)
+        if len(items) == DRAIN_LIMIT:
+            again.append(screen_name)
+        for item in items:
+            dispatcher.add(screen_name, api, 'POST',
+                           '/statuses/retweet/%d.json' % item.tweet_id, item)
+
+    done = {}
+    for wave in dispatcher.waves(deadline):
+        sent = [call for call in wave if call.latency is not None]
+        for call in sent:
+            item = call.context
+            settle(item, call.error)
+            if item.done:
+                done.setdefault(call.key, []).append(item.tweet_id)
+            if call.error is not None:
+                logging.warning("Could not retweet %d for %s: %s",
+                                item.tweet_id, call.key, call.error)
+                if not item.done:
+                    retry.add(call.key)
+        if sent:
+            db.put([call.context for call in sent])
+
+    calls = []
+    for call in dispatcher.all_calls():
+        if call.latency is not None:
+            calls.append(call)
+        elif call.key not in again:
+            # not sent before the deadline
+            again.append(call.key)
+    retry.difference_update(again)
+
+    for screen_name, tweet_ids in done.items():
+        record(screen_name, tweet_ids)
+
+    count, failures, median, slowest = summarize(calls)
+    logging.info("Retweeted %d tweets (%d failed) for %d users in %.2fs: "
+                 "median %.3fs, max %.3fs per call.",
+                 count - failures, failures, len(users),
+                 time.time() - started, median, slowest)
+
+    schedule(again)
+    schedule(list(retry), RETRY_DELAY)
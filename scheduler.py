@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2010 Ron Huang
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+
+from datetime import datetime, timedelta
+
+
+MIN_INTERVAL = 10 # minutes, as often as cron.yml fires /trigger
+DEFAULT_INTERVAL = 30 # minutes
+MAX_INTERVAL = 24 * 60 # minutes
+BUSY_TWEETS = 50 # new tweets in one run making a list busy
+
+
+def make_due(criterion, now=None):
+    """Have the criterion collected by the next trigger."""
+    criterion.next_due = now or datetime.utcnow()
+
+
+def reschedule(criterion, tweets, matches, backlog, now=None):
+    """Set when the criterion is next collected, from what its run yielded.
+
+    Quiet lists back off up to MAX_INTERVAL, lists with matches or a full
+    page of new tweets are polled up to MIN_INTERVAL, and a backlog left
+    by the page budget is resumed as soon as possible.
+    """
+    interval = criterion.interval or DEFAULT_INTERVAL
+    if tweets == 0:
+        interval = min(interval * 2, MAX_INTERVAL)
+    elif matches > 0 or tweets >= BUSY_TWEETS:
+        interval = max(interval // 2, MIN_INTERVAL)
+
+    criterion.interval = interval
+    criterion.last_tweets = tweets
+    criterion.last_matches = matches
+    if backlog:
+        interval = MIN_INTERVAL
+    criterion.next_due = (now or datetime.utcnow()) + timedelta(minutes=interval)
+
+
+def defer(criterion, seconds, now=None):
+    """Postpone the criterion, e.g. until its rate limit is reset."""
+    criterion.next_due = (now or datetime.utcnow()) + timedelta(seconds=seconds)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2010 Ron Huang
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+
+import os
+import re
+from google.appengine.api import memcache
+from google.appengine.ext import db
+from models import User, Session
+
+
+COOKIE = "sid"
+LEGACY_COOKIES = ("ulg", "auau") # raw access token of older versions
+CACHE_LIFE = 60 * 60 # seconds a session stays in memcache
+NAMESPACE = 'session'
+
+SID_PATTERN = re.compile(r'^([1-9][0-9]{0,17})-([0-9a-f]{32})\Z')
+
+
+def _parse(sid):
+    # "<user id>-<random id>", anything else is not one of ours
+    match = SID_PATTERN.match(sid)
+    if match is None:
+        return None, None
+    user_key = db.Key.from_path('User', int(match.group(1)))
+    return user_key, db.Key.from_path('Session', match.group(2),
+                                      parent=user_key)
+
+
+def cache_user(user):
+    """Store the user in memcache, e.g. after its token changed."""
+    memcache.set(str(user.key()), db.model_to_protobuf(user).Encode(),
+                 time=CACHE_LIFE, namespace=NAMESPACE)
+
+
+def get_user_by_token(token_key, token_secret):
+    """Return the user owning the access token."""
+    return User.gql("WHERE token_key=:key AND token_secret=:secret",
+                    key=token_key, secret=token_secret).get()
+
+
+def start(cookies, user):
+    """Sign the user in on the browser behind the cookies."""
+    token = os.urandom(16).encode('hex')
+    session = Session(parent=user, key_name=token)
+    session.put()
+    sid = "%d-%s" % (user.key().id(), token)
+    memcache.set_multi({sid: 1,
+                        str(user.key()): db.model_to_protobuf(user).Encode()},
+                       time=CACHE_LIFE, namespace=NAMESPACE)
+    cookies[COOKIE] = sid
+    for name in LEGACY_COOKIES:
+        if name in cookies:
+            del cookies[name]
+
+
+def get_user(cookies):
+    """Return the signed in user of the cookies, or None."""
+    if COOKIE not in cookies:
+        return _migrate(cookies)
+
+    sid = cookies[COOKIE]
+    user_key, session_key = _parse(sid)
+    if user_key is None:
+        return None
+
+    cached = memcache.get_multi([sid, str(user_key)], namespace=NAMESPACE)
+    if len(cached) == 2:
+        return db.model_from_protobuf(cached[str(user_key)])
+
+    user, session = db.get([user_key, session_key])
+    if user is None or session is None:
+        return None
+    memcache.set_multi({sid: 1,
+                        str(user_key): db.model_to_protobuf(user).Encode()},
+                       time=CACHE_LIFE, namespace=NAMESPACE)
+    return user
+
+
+def _migrate(cookies):
+    # swap the raw token cookies of older versions for a session
+    for name in LEGACY_COOKIES:
+        if name not in cookies:
+            return None
+    user = get_user_by_token(*[cookies[name] for name in LEGACY_COOKIES])
+    if user is not None:
+        start(cookies, user)
+    return user
+
+
+def end(cookies):
+    """Sign out the browser behind the cookies."""
+    if COOKIE in cookies:
+        sid = cookies[COOKIE]
+        user_key, session_key = _parse(sid)
+        if session_key is not None:
+            db.delete(session_key)
+            memcache.delete(sid, namespace=NAMESPACE)
+        del cookies[COOKIE]
+    for name in LEGACY_COOKIES:
+        if name in cookies:
+            del cookies[name]
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2010 Ron Huang
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+
+import unittest
+
+from collector import Progress, next_window
+
+
+class Mark(object):
+    """Stands in for a Watermark."""
+
+    def __init__(self, since_id=None, max_id=None, top_id=None):
+        self.since_id = since_id
+        self.max_id = max_id
+        self.top_id = top_id
+
+
+def walk(complete=True, top_id=None, oldest_id=None):
+    progress = Progress()
+    progress.complete = complete
+    progress.top_id = top_id
+    progress.oldest_id = oldest_id
+    return progress
+
+
+class NextWindowTest(unittest.TestCase):
+
+    def test_complete_moves_since_id_to_newest(self):
+        self.assertEqual(next_window(Mark(100), walk(True, 150, 101)),
+                         (150, None, None))
+
+    def test_complete_without_tweets_keeps_since_id(self):
+        self.assertEqual(next_window(Mark(100), walk()), (100, None, None))
+        self.assertEqual(next_window(Mark(), walk()), (1, None, None))
+
+    def test_complete_backlog_moves_since_id_to_top_id(self):
+        mark = Mark(100, 300, 500)
+        self.assertEqual(next_window(mark, walk(True, 300, 101)),
+                         (500, None, None))
+
+    def test_stopped_before_first_page_keeps_mark(self):
+        mark = Mark(100, 300, 500)
+        self.assertEqual(next_window(mark, walk(False)), (100, 300, 500))
+
+    def test_stopped_midway_resumes_below_oldest(self):
+        self.assertEqual(next_window(Mark(100), walk(False, 500, 301)),
+                         (100, 300, 500))
+
+    def test_stopped_midway_keeps_top_id(self):
+        mark = Mark(100, 300, 500)
+        self.assertEqual(next_window(mark, walk(False, 300, 201)),
+                         (100, 200, 500))
+
+    def test_first_run_stopped_midway(self):
+        self.assertEqual(next_window(Mark(), walk(False, 500, 301)),
+                         (None, 300, 500))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2010 Ron Huang
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+
+import time
+import unittest
+
+from tweepy import Cursor
+from tweepy.cursor import PrefetchIterator
+from tweepy.utils import threads_available
+
+
+class Item(object):
+
+    def __init__(self, id):
+        self.id = id
+
+
+class FakeTimeline(object):
+    """A paged API method over ids count down to 1, newest first."""
+
+    pagination_mode = 'page'
+
+    def __init__(self, count, per_page=10):
+        self.ids = range(count, 0, -1)
+        self.per_page = per_page
+        self.requested = []
+
+    def __call__(self, page=1):
+        self.requested.append(page)
+        start = (page - 1) * self.per_page
+        return [Item(i) for i in self.ids[start:start + self.per_page]]
+
+
+def ids(pages):
+    return [[item.id for item in page] for page in pages]
+
+
+class PagesTest(unittest.TestCase):
+
+    def test_all_pages(self):
+        timeline = FakeTimeline(25)
+        self.assertEqual([len(p) for p in ids(Cursor(timeline).pages())],
+                         [10, 10, 5])
+        # only an empty page told the pages apart from full ones
+        self.assertEqual(timeline.requested, [1, 2, 3, 4])
+
+    def test_cut_at_since_id(self):
+        timeline = FakeTimeline(100)
+        pages = ids(Cursor(timeline).pages(since_id=85))
+        self.assertEqual(pages, [range(100, 90, -1), range(90, 85, -1)])
+        self.assertEqual(timeline.requested, [1, 2])
+
+    def test_cut_at_stop(self):
+        timeline = FakeTimeline(100)
+        pages = ids(Cursor(timeline).pages(stop=lambda item: item.id == 95))
+        self.assertEqual(pages, [range(100, 95, -1)])
+        self.assertEqual(timeline.requested, [1])
+
+    def test_short_page_ends(self):
+        timeline = FakeTimeline(25)
+        pages = ids(Cursor(timeline).pages(page_size=10))
+        self.assertEqual([len(p) for p in pages], [10, 10, 5])
+        self.assertEqual(timeline.requested, [1, 2, 3])
+
+    def test_limit_checked_before_fetching(self):
+        timeline = FakeTimeline(100)
+        pages = Cursor(timeline).pages(2)
+        self.assertEqual(len(ids(pages)), 2)
+        self.assertRaises(StopIteration, pages.next)
+        self.assertEqual(timeline.requested, [1, 2])
+
+    def test_items_cut_at_since_id(self):
+        timeline = FakeTimeline(100)
+        items = [i.id for i in Cursor(timeline).items(since_id=88)]
+        self.assertEqual(items, range(100, 88, -1))
+        self.assertEqual(timeline.requested, [1, 2])
+
+
+class PrefetchTest(unittest.TestCase):
+    """Where threads are not available pages are not prefetched."""
+
+    def test_pages_in_order(self):
+        if not threads_available():
+            return
+        timeline = FakeTimeline(25)
+        pages = Cursor(timeline).pages(prefetch=2, page_size=10)
+        self.assertTrue(isinstance(pages, PrefetchIterator))
+        self.assertEqual([len(p) for p in ids(pages)], [10, 10, 5])
+        self.assertEqual(timeline.requested, [1, 2, 3])
+
+    def test_close_early(self):
+        if not threads_available():
+            return
+        timeline = FakeTimeline(1000)
+        pages = Cursor(timeline).pages(prefetch=1)
+        self.assertEqual(ids([pages.next()]), [range(1000, 990, -1)])
+        pages.close()
+        time.sleep(0.5)
+        fetched = len(timeline.requested)
+        # the page buffered and the one waiting for room at most
+        self.assertTrue(fetched <= 3)
+        time.sleep(0.5)
+        self.assertEqual(len(timeline.requested), fetched)
+
+
+if __name__ == '__main__':
+    unittest.main()
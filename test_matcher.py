@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2010 Ron Huang
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+
+import unittest
+
+import matcher
+from matcher import Matcher, UnsafeTerm, check_term, is_safe
+
+
+class FakeClock(object):
+    """Stands in for the time module, each clock() call takes step seconds."""
+
+    def __init__(self, step):
+        self.step = step
+        self.now = 0.0
+
+    def clock(self):
+        self.now += self.step
+        return self.now
+
+
+class CheckTermTest(unittest.TestCase):
+
+    def test_accepts_plain_terms(self):
+        for term in ('keyword', '#hash_tag', '@screen_name', 'foo[0-9]+',
+                     '(a|b)+c', 'colou?r', 'a{2,5}'):
+            self.assertEqual(check_term(term), term)
+
+    def test_strips_wildcards(self):
+        self.assertEqual(check_term('.*foo.*'), 'foo')
+        self.assertEqual(check_term('.*?foo'), 'foo')
+        self.assertEqual(check_term('foo\\.*'), 'foo\\.*')
+
+    def test_rejects_long_terms(self):
+        self.assertRaises(UnsafeTerm, check_term,
+                          'a' * (matcher.MAX_TERM_LENGTH + 1))
+
+    def test_rejects_invalid_terms(self):
+        self.assertRaises(UnsafeTerm, check_term, '(foo')
+        self.assertRaises(UnsafeTerm, check_term, '*foo')
+
+    def test_rejects_nested_repeats(self):
+        for term in ('(a+)+b', '(a*)*b', '(a{2,}){2,}', '(a{100}){100}'):
+            self.assertRaises(UnsafeTerm, check_term, term)
+        self.assertEqual(check_term('(a{2}){3}'), '(a{2}){3}')
+
+    def test_rejects_alternation_in_repeat(self):
+        for term in ('(a|a)+b', '(ab|a)*c', '(foo|bar){2,}'):
+            self.assertRaises(UnsafeTerm, check_term, term)
+        self.assertEqual(check_term('(foo|bar)x'), '(foo|bar)x')
+        self.assertEqual(check_term('(foo|bar)?x'), '(foo|bar)?x')
+
+    def test_rejects_overlapping_repeats(self):
+        for term in (r'\w*\w*\w*\w*!', 'x.*.*.*.*y', r'\w+\d+', r'(\w+)\w*'):
+            self.assertRaises(UnsafeTerm, check_term, term)
+        for term in (r'\d+-\d+', r'\d+\s+\w+', r'#\w+ .*foo', r'x\w{2}\w*'):
+            self.assertEqual(check_term(term), term)
+
+
+class MatcherTest(unittest.TestCase):
+
+    def tearDown(self):
+        matcher.time = __import__('time')
+
+    def test_literals(self):
+        m = Matcher(['Foo', 'bar'])
+        self.assertEqual(m.matches('a FOO here'), set([0]))
+        self.assertEqual(m.matches('foo and bar'), set([0, 1]))
+        self.assertTrue(m.search('BAR'))
+        self.assertFalse(m.search('nothing'))
+
+    def test_keywords(self):
+        terms = ['w%d' % i for i in range(matcher.KEYWORD_THRESHOLD)]
+        m = Matcher(terms)
+        self.assertTrue(m.keywords is not None)
+        self.assertEqual(m.matches('w3 and W5'), set([3, 5]))
+
+    def test_combined_regexes(self):
+        m = Matcher(['foo[0-9]', 'ba+r', 'plain'])
+        self.assertTrue(m.combined is not None)
+        self.assertEqual(m.matches('foo1 baaar plain'), set([0, 1, 2]))
+        self.assertEqual(m.matches('baar'), set([1]))
+        self.assertEqual(m.matches('foo'), set())
+        self.assertTrue(m.search('foo7'))
+        self.assertFalse(m.search('br'))
+
+    def test_too_many_groups_are_not_combined(self):
+        m = Matcher(['(a)b%dz' % i for i in range(101)])
+        self.assertTrue(m.combined is None)
+        self.assertEqual(m.matches('ab7z ab100z'), set([7, 100]))
+
+    def test_unsafe_terms_never_match(self):
+        m = Matcher(['(a|a)+b', r'\w*\w*!', 'foo[0-9]'])
+        self.assertEqual(m.standalone, [])
+        self.assertEqual(m.regexes, [2])
+        self.assertEqual(m.matches('aab ab! foo1'), set([2]))
+
+    def test_invalid_terms_never_match(self):
+        m = Matcher(['(foo', 'bar'])
+        self.assertEqual(m.matches('(foo bar'), set([1]))
+
+    def test_standalone_budget(self):
+        matcher.time = FakeClock(1.0)
+        m = Matcher([r'(x)\1y', 'foo'], budget=2.5)
+        self.assertTrue(m.search('xxy'))
+        self.assertTrue(m.search('xxy'))
+        self.assertTrue(m.search('xxy'))
+        self.assertEqual(m.disabled, set([0]))
+        self.assertFalse(m.search('xxy'))
+
+    def test_combined_budget(self):
+        matcher.time = FakeClock(1.0)
+        m = Matcher(['foo[0-9]', 'ba+r'], budget=2.5)
+        for i in range(3):
+            m.matches('nothing')
+        self.assertTrue(m.combined is None)
+        # searched one by one, each term has its own budget
+        self.assertEqual(m.elapsed, [0.0, 0.0])
+        self.assertEqual(m.matches('foo1 bar'), set([0, 1]))
+        self.assertEqual(m.disabled, set())
+
+
+if __name__ == '__main__':
+    unittest.main()
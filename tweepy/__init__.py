@@ -10,12 +10,17 @@ __author__ = 'Joshua Roesslein'
 __license__ = 'MIT'
 
 from tweepy.models import Status, User, DirectMessage, Friendship, SavedSearch, SearchResult, ModelFactory
-from tweepy.error import TweepError
+from tweepy.error import TweepError, RateLimitError, DeadlineExceeded
 from tweepy.api import API
 from tweepy.cache import Cache, MemoryCache, FileCache
 from tweepy.auth import BasicAuthHandler, OAuthHandler
 from tweepy.streaming import Stream, StreamListener
 from tweepy.cursor import Cursor
+from tweepy.ratelimit import RateLimiter
+from tweepy.pool import ConnectionPool
+from tweepy.deadline import Deadline
+from tweepy.retry import RetryPolicy, BackoffRetry, RetryBudget
+from tweepy.executor import Executor, Future, gather
 
 # Global, unauthenticated instance of API
 api = API()
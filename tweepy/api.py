@@ -8,6 +8,7 @@ import mimetypes
 from tweepy.binder import bind_api
 from tweepy.error import TweepError
 from tweepy.parsers import ModelParser
+from tweepy.pool import ConnectionPool
 from tweepy.utils import list_to_csv
 
 
@@ -18,7 +19,8 @@ class API(object):
             host='api.twitter.com', search_host='search.twitter.com',
              cache=None, secure=False, api_root='/1', search_root='',
             retry_count=0, retry_delay=0, retry_errors=None,
-            parser=None):
+            parser=None, rate_limiter=None, pool=None, timeout=None,
+            retry_policy=None):
         self.auth = auth_handler
         self.host = host
         self.search_host = search_host
@@ -30,6 +32,10 @@ class API(object):
         self.retry_delay = retry_delay
         self.retry_errors = retry_errors
         self.parser = parser or ModelParser()
+        self.rate_limiter = rate_limiter
+        self.pool = pool or ConnectionPool()
+        self.timeout = timeout
+        self.retry_policy = retry_policy
 
     """ statuses/public_timeline """
     public_timeline = bind_api(
@@ -2,12 +2,13 @@
 # Copyright 2009-2010 Joshua Roesslein
 # See LICENSE for details.
 
-import httplib
 import urllib
 import time
 import re
+import socket
 
-from tweepy.error import TweepError
+from tweepy.error import TweepError, RateLimitError, DeadlineExceeded
+from tweepy.retry import RetryPolicy
 from tweepy.utils import convert_to_utf8_str
 
 re_path_template = re.compile('{\w+}')
@@ -36,7 +37,13 @@ def bind_api(**config):
             self.retry_count = kargs.pop('retry_count', api.retry_count)
             self.retry_delay = kargs.pop('retry_delay', api.retry_delay)
             self.retry_errors = kargs.pop('retry_errors', api.retry_errors)
+            self.retry_policy = kargs.pop('retry_policy', api.retry_policy)
+            if self.retry_policy is None:
+                self.retry_policy = RetryPolicy(
+                        self.retry_count, self.retry_delay, self.retry_errors)
             self.headers = kargs.pop('headers', {})
+            self.timeout = kargs.pop('timeout', api.timeout)
+            self.deadline = kargs.pop('deadline', None)
             self.build_parameters(args, kargs)
 
             # Pick correct URL root to use
@@ -45,6 +52,9 @@ def bind_api(**config):
             else:
                 self.api_root = api.api_root
 
+            # Rate limits are tracked per endpoint, before substitution
+            self.endpoint = self.path
+
             # Perform any path variable substitution
             self.build_path()
 
@@ -97,6 +107,33 @@ def bind_api(**config):
 
                 self.path = self.path.replace(variable, value)
 
+        def rate_limit_token(self):
+            auth = self.api.auth
+            if getattr(auth, 'access_token', None):
+                return auth.access_token.key
+            return getattr(auth, 'username', None) or 'anonymous'
+
+        def send(self, url, timeout):
+            pool = self.api.pool
+            while True:
+                conn, reused = pool.get(self.host, self.api.secure)
+                conn.timeout = timeout
+                if conn.sock:
+                    conn.sock.settimeout(timeout)
+                try:
+                    conn.request(self.method, url, headers=self.headers, body=self.post_data)
+                    return conn, conn.getresponse()
+                except Exception, e:
+                    conn.close()
+                    if self.deadline and self.deadline.expired():
+                        raise DeadlineExceeded('Deadline exceeded: %s' % e)
+                    if not reused or isinstance(e, socket.timeout):
+                        raise TweepError('Failed to send request: %s' % e)
+                    # the server closed the idle connection meanwhile
+
+        def past_deadline(self, delay):
+            return self.deadline and self.deadline.remaining() < delay
+
         def execute(self):
             # Build the request URL
             url = self.api_root + self.path
@@ -117,16 +154,27 @@ def bind_api(**config):
                         cache_result._api = self.api
                     return cache_result
 
+            # Refuse the request if it would exceed the rate limit, unless
+            # its turn comes soon. Only GET requests count against it.
+            limiter = self.api.rate_limiter
+            if limiter and self.method == 'GET':
+                token = self.rate_limit_token()
+                delay = limiter.delay(token, self.endpoint)
+                while 0 < delay <= limiter.max_wait and not self.past_deadline(delay):
+                    time.sleep(delay)
+                    delay = limiter.delay(token, self.endpoint)
+                if delay > 0:
+                    raise RateLimitError('Rate limit reached for %s, retry in %ds'
+                                         % (self.endpoint, delay), delay)
+
             # Continue attempting request until successful
-            # or maximum number of retries is reached.
+            # or the retry policy gives up.
             retries_performed = 0
-            while retries_performed < self.retry_count + 1:
-                # Open connection
-                # FIXME: add timeout
-                if self.api.secure:
-                    conn = httplib.HTTPSConnection(self.host)
-                else:
-                    conn = httplib.HTTPConnection(self.host)
+            while True:
+                # No request may outlive the deadline
+                timeout = self.timeout
+                if self.deadline:
+                    timeout = self.deadline.timeout(timeout)
 
                 # Apply authentication
                 if self.api.auth:
@@ -137,34 +185,53 @@ def bind_api(**config):
 
                 # Execute request
                 try:
-                    conn.request(self.method, url, headers=self.headers, body=self.post_data)
-                    resp = conn.getresponse()
-                except Exception, e:
-                    raise TweepError('Failed to send request: %s' % e)
-
-                # Exit request loop if non-retry error code
-                if self.retry_errors:
-                    if resp.status not in self.retry_errors: break
+                    conn, resp = self.send(url, timeout)
+                except DeadlineExceeded:
+                    raise
+                except TweepError, e:
+                    delay = self.retry_policy.retry(
+                            retries_performed, self.method, error=e)
+                    if delay is None or self.past_deadline(delay):
+                        raise
                 else:
-                    if resp.status == 200: break
+                    # Exit request loop if the policy does not retry
+                    delay = self.retry_policy.retry(
+                            retries_performed, self.method, response=resp)
+                    if delay is None or self.past_deadline(delay): break
+
+                    # Drain the response so the connection can be reused
+                    try:
+                        resp.read()
+                        self.api.pool.put(conn, resp)
+                    except Exception:
+                        conn.close()
 
                 # Sleep before retrying request again
-                time.sleep(self.retry_delay)
+                time.sleep(delay)
                 retries_performed += 1
 
             # If an error was returned, throw an exception
             self.api.last_response = resp
+            if limiter and self.method == 'GET':
+                limiter.update(token, self.endpoint, resp)
+
+            # Read the whole payload before the connection is reused
+            try:
+                payload = resp.read()
+            except Exception, e:
+                conn.close()
+                raise TweepError('Failed to read response: %s' % e, resp)
+            self.api.pool.put(conn, resp)
+
             if resp.status != 200:
                 try:
-                    error_msg = self.api.parser.parse_error(resp.read())
+                    error_msg = self.api.parser.parse_error(payload)
                 except Exception:
                     error_msg = "Twitter error response: status code = %s" % resp.status
                 raise TweepError(error_msg, resp)
 
             # Parse the response payload
-            result = self.api.parser.parse(self, resp.read())
-
-            conn.close()
+            result = self.api.parser.parse(self, payload)
 
             # Store result into cache if one is available.
             if self.api.cache and self.method == 'GET' and result:
@@ -2,7 +2,11 @@
 # Copyright 2009-2010 Joshua Roesslein
 # See LICENSE for details.
 
+import threading
+import Queue
+
 from tweepy.error import TweepError
+from tweepy.utils import threads_available
 
 class Cursor(object):
     """Pagination helper class"""
@@ -16,15 +20,32 @@ class Cursor(object):
         else:
             raise TweepError('This method does not perform pagination')
 
-    def pages(self, limit=0):
-        """Return iterator for pages"""
+    def pages(self, limit=0, prefetch=0, since_id=None, stop=None,
+              page_size=0):
+        """Return iterator for pages
+
+        With prefetch, up to that many pages are fetched ahead in the
+        background while the current one is processed. Where threads are
+        not available pages are fetched one by one as usual.
+
+        Iteration ends, without fetching another page, at the first item
+        whose id is since_id or lower, at the first item stop(item) is
+        true for, or after a page of fewer than page_size items. The item
+        it ends at is left out.
+        """
         if limit > 0:
             self.iterator.limit = limit
+        self.iterator.since_id = since_id
+        self.iterator.stop = stop
+        self.iterator.page_size = page_size
+        if prefetch > 0 and threads_available():
+            return PrefetchIterator(self.iterator, prefetch)
         return self.iterator
 
-    def items(self, limit=0):
+    def items(self, limit=0, prefetch=0, since_id=None, stop=None,
+              page_size=0):
         """Return iterator for items in each page"""
-        i = ItemIterator(self.iterator)
+        i = ItemIterator(self.pages(0, prefetch, since_id, stop, page_size))
         i.limit = limit
         return i
 
@@ -35,6 +56,21 @@ class BaseIterator(object):
         self.args = args
         self.kargs = kargs
         self.limit = 0
+        self.since_id = None
+        self.stop = None
+        self.page_size = 0
+        self.finished = False
+
+    def end_check(self, items):
+        """Cut the page at the item iteration ends at, if any."""
+        for i, item in enumerate(items):
+            if (self.since_id is not None and item.id <= self.since_id) or \
+                    (self.stop is not None and self.stop(item)):
+                self.finished = True
+                return items[:i]
+        if self.page_size and len(items) < self.page_size:
+            self.finished = True
+        return items
 
     def next(self):
         raise NotImplementedError
@@ -45,6 +81,9 @@ class BaseIterator(object):
     def __iter__(self):
         return self
 
+    def close(self):
+        pass
+
 class CursorIterator(BaseIterator):
 
     def __init__(self, method, args, kargs):
@@ -54,12 +93,13 @@ class CursorIterator(BaseIterator):
         self.count = 0
 
     def next(self):
-        if self.next_cursor == 0 or (self.limit and self.count == self.limit):
+        if self.finished or self.next_cursor == 0 or (self.limit and self.count == self.limit):
             raise StopIteration
         data, cursors = self.method(
                 cursor=self.next_cursor, *self.args, **self.kargs
         )
         self.prev_cursor, self.next_cursor = cursors
+        data = self.end_check(data)
         if len(data) == 0:
             raise StopIteration
         self.count += 1
@@ -81,9 +121,12 @@ class PageIterator(BaseIterator):
         self.current_page = 0
 
     def next(self):
+        if self.finished or (self.limit > 0 and self.current_page >= self.limit):
+            raise StopIteration
         self.current_page += 1
         items = self.method(page=self.current_page, *self.args, **self.kargs)
-        if len(items) == 0 or (self.limit > 0 and self.current_page > self.limit):
+        items = self.end_check(items)
+        if len(items) == 0:
             raise StopIteration
         return items
 
@@ -126,3 +169,61 @@ class ItemIterator(BaseIterator):
         self.count -= 1
         return self.current_page[self.page_index]
 
+    def close(self):
+        self.page_iterator.close()
+
+def _prefetch(page_iterator, queue, stop):
+    # runs in the background, without a reference to the PrefetchIterator
+    # so dropping that still closes it
+    while not stop.isSet():
+        try:
+            job = (page_iterator.next(), None)
+        except StopIteration:
+            job = (None, StopIteration())
+        except Exception, e:
+            job = (None, e)
+        while not stop.isSet():
+            try:
+                queue.put(job, timeout=0.1)
+                break
+            except Queue.Full:
+                pass
+        if job[1] is not None:
+            return
+
+class PrefetchIterator(BaseIterator):
+    """Fetch pages of another page iterator ahead, in a background thread.
+
+    At most depth pages are buffered. The thread stops when the pages run
+    out, on the first error, which is raised in turn, or once the iterator
+    is closed or dropped.
+    """
+
+    def __init__(self, page_iterator, depth):
+        self.queue = Queue.Queue(depth)
+        self.stop = threading.Event()
+        self.finished = False
+        thread = threading.Thread(target=_prefetch,
+                                  args=(page_iterator, self.queue, self.stop))
+        thread.setDaemon(True)
+        thread.start()
+
+    def next(self):
+        if self.finished:
+            raise StopIteration
+        page, error = self.queue.get()
+        if error is not None:
+            self.finished = True
+            self.close()
+            raise error
+        return page
+
+    def prev(self):
+        raise TweepError('Can not page back while prefetching')
+
+    def close(self):
+        self.stop.set()
+
+    def __del__(self):
+        self.close()
+
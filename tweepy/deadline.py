@@ -0,0 +1,35 @@
+# Tweepy
+# Copyright 2010 Joshua Roesslein
+# See LICENSE for details.
+
+import time
+
+from tweepy.error import DeadlineExceeded
+
+
+class Deadline(object):
+    """Point in time a series of calls must be done by.
+
+    Pass it as the deadline parameter of API methods, or of a Cursor to
+    cover every page. Each request then times out no later than the
+    deadline, and no request or retry is started after it.
+    """
+
+    def __init__(self, seconds):
+        self.expires = time.time() + seconds
+
+    def remaining(self):
+        """Return the seconds left, negative once expired."""
+        return self.expires - time.time()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, timeout=None):
+        """Return the timeout to use for a request started now."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded('Deadline exceeded')
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
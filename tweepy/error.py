@@ -12,3 +12,16 @@ class TweepError(Exception):
     def __str__(self):
         return self.reason
 
+
+class RateLimitError(TweepError):
+    """Call refused because the rate limit would be exceeded"""
+
+    def __init__(self, reason, retry_after, response=None):
+        TweepError.__init__(self, reason, response)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(TweepError):
+    """Call not made because its deadline passed"""
+    pass
+
@@ -0,0 +1,146 @@
+# Tweepy
+# Copyright 2010 Joshua Roesslein
+# See LICENSE for details.
+
+import threading
+import Queue
+
+from tweepy.utils import threads_available
+
+
+class Future(object):
+    """Outcome of a call submitted to an Executor."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._error = None
+
+    def _set(self, result, error):
+        self._result = result
+        self._error = error
+        self._event.set()
+
+    def done(self):
+        return self._event.isSet()
+
+    def wait(self, timeout=None):
+        """Wait for the call to finish, return whether it did."""
+        self._event.wait(timeout)
+        return self._event.isSet()
+
+    def exception(self, timeout=None):
+        """Return the error raised by the call, None if it succeeded."""
+        if not self.wait(timeout):
+            raise RuntimeError('Call not finished')
+        return self._error
+
+    def result(self, timeout=None):
+        """Return the result of the call, or raise its error."""
+        error = self.exception(timeout)
+        if error is not None:
+            raise error
+        return self._result
+
+
+class Executor(object):
+    """Run API calls on a bounded pool of worker threads.
+
+    Any bound API method can be submitted, with the arguments it takes
+    when called directly. Threads are started on demand, up to workers,
+    and stop on shutdown(). An executor may be shared by several API
+    instances to cap their calls in flight together.
+
+    Where the runtime does not allow threads, calls run in submit() and
+    the future returned is already done.
+    """
+
+    def __init__(self, workers=4):
+        self.workers = workers
+        self.threads = []
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+
+    def submit(self, method, *args, **kargs):
+        """Schedule method(*args, **kargs) and return its Future."""
+        future = Future()
+        if not threads_available():
+            self._run(future, method, args, kargs)
+            return future
+
+        self.queue.put((future, method, args, kargs))
+        self.lock.acquire()
+        try:
+            if len(self.threads) < self.workers:
+                thread = threading.Thread(target=self._work)
+                thread.setDaemon(True)
+                thread.start()
+                self.threads.append(thread)
+        finally:
+            self.lock.release()
+        return future
+
+    def bind(self, api):
+        """Return a view of api whose methods return futures."""
+        return AsyncAPI(self, api)
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            self._run(*job)
+
+    def _run(self, future, method, args, kargs):
+        try:
+            future._set(method(*args, **kargs), None)
+        except Exception, e:
+            future._set(None, e)
+
+    def shutdown(self, wait=True):
+        """Stop the workers once the submitted calls are done."""
+        self.lock.acquire()
+        try:
+            threads = self.threads
+            self.threads = []
+        finally:
+            self.lock.release()
+        for thread in threads:
+            self.queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+
+class AsyncAPI(object):
+    """API methods submitted to an executor instead of called."""
+
+    def __init__(self, executor, api):
+        self._executor = executor
+        self._api = api
+
+    def __getattr__(self, name):
+        method = getattr(self._api, name)
+        if not callable(method):
+            return method
+        def submit(*args, **kargs):
+            return self._executor.submit(method, *args, **kargs)
+        return submit
+
+
+def gather(futures, timeout=None, return_errors=False):
+    """Wait for all futures and return their results, in order.
+
+    timeout bounds the wait for each future. The first error is raised,
+    unless return_errors is set, then errors take the place of results.
+    """
+    results = []
+    for future in futures:
+        error = future.exception(timeout)
+        if error is None:
+            results.append(future._result)
+        elif return_errors:
+            results.append(error)
+        else:
+            raise error
+    return results
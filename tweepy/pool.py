@@ -0,0 +1,82 @@
+# Tweepy
+# Copyright 2010 Joshua Roesslein
+# See LICENSE for details.
+
+import httplib
+import threading
+
+
+class ConnectionPool(object):
+    """Keep-alive HTTP connections, kept idle per host between requests.
+
+    A connection is only given back once its response was read in full
+    and the server did not ask to close it. The pool may be shared by
+    API instances running in several threads.
+    """
+
+    def __init__(self, max_idle=10, max_per_host=4):
+        """Initialize the pool
+            max_idle: idle connections kept over all hosts
+            max_per_host: idle connections kept per host
+        """
+        self.max_idle = max_idle
+        self.max_per_host = max_per_host
+        self.hits = 0
+        self.misses = 0
+        self._idle = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def connect(self, host, secure=False):
+        """Open a new connection to host."""
+        if secure:
+            conn = httplib.HTTPSConnection(host)
+        else:
+            conn = httplib.HTTPConnection(host)
+        # host may carry a port, remember it as given
+        conn.pool_key = (host, secure)
+        return conn
+
+    def get(self, host, secure=False):
+        """Return a connection to host and whether it was used before."""
+        self._lock.acquire()
+        try:
+            conns = self._idle.get((host, secure))
+            if conns:
+                self.hits += 1
+                self._count -= 1
+                return conns.pop(), True
+            self.misses += 1
+        finally:
+            self._lock.release()
+        return self.connect(host, secure), False
+
+    def put(self, conn, response):
+        """Give back a connection once response was read."""
+        if not response.isclosed() or response.will_close:
+            conn.close()
+            return
+
+        self._lock.acquire()
+        try:
+            conns = self._idle.setdefault(conn.pool_key, [])
+            if len(conns) < self.max_per_host and self._count < self.max_idle:
+                conns.append(conn)
+                self._count += 1
+                return
+        finally:
+            self._lock.release()
+        conn.close()
+
+    def close(self):
+        """Close all idle connections."""
+        self._lock.acquire()
+        try:
+            idle = self._idle
+            self._idle = {}
+            self._count = 0
+        finally:
+            self._lock.release()
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
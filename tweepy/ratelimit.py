@@ -0,0 +1,84 @@
+# Tweepy
+# Copyright 2010 Joshua Roesslein
+# See LICENSE for details.
+
+import time
+
+from tweepy.cache import MemoryCache
+
+
+class RateLimiter(object):
+    """Rate limit governor shared by API instances.
+
+    The X-RateLimit-* headers of every response are remembered per access
+    token and endpoint, so calls to an exhausted endpoint are refused
+    until its reset time. On top of that a token bucket per access token
+    spreads calls over the rate limit window instead of spending the whole
+    allowance at once.
+
+    State is kept in a tweepy Cache, so it can be shared between processes
+    by passing a cache they all use.
+
+    Calls that would wait no longer than max_wait seconds wait instead of
+    being refused.
+    """
+
+    def __init__(self, limit=350, window=3600, burst=30, cache=None,
+                 max_wait=0):
+        """Initialize the governor
+            limit: calls allowed per window, until a response tells otherwise
+            window: length of the rate limit window in seconds
+            burst: calls allowed back to back
+            cache: where the state is kept [optional]
+            max_wait: seconds a call may wait for its turn
+        """
+        self.limit = limit
+        self.window = window
+        self.burst = burst
+        self.max_wait = max_wait
+        self.cache = cache or MemoryCache(timeout=window)
+
+    def _bucket(self, token, now):
+        bucket = self.cache.get('bucket:%s' % token)
+        if bucket is None:
+            return float(self.burst), now, self.limit
+        tokens, updated, limit = bucket
+        rate = float(limit) / self.window
+        return min(self.burst, tokens + (now - updated) * rate), now, limit
+
+    def delay(self, token, endpoint):
+        """Return the seconds to wait before calling endpoint with token.
+
+        A call is accounted for when 0 is returned.
+        """
+        now = time.time()
+        status = self.cache.get('status:%s:%s' % (token, endpoint))
+        if status is not None:
+            remaining, reset = status
+            if remaining <= 0 and reset > now:
+                return reset - now
+
+        tokens, updated, limit = self._bucket(token, now)
+        if tokens < 1:
+            return (1 - tokens) * self.window / float(limit)
+        self.cache.store('bucket:%s' % token, (tokens - 1, updated, limit))
+        return 0
+
+    def update(self, token, endpoint, response):
+        """Remember the rate limit status sent with a response."""
+        try:
+            remaining = int(response.getheader('X-RateLimit-Remaining'))
+            reset = int(response.getheader('X-RateLimit-Reset'))
+        except (TypeError, ValueError):
+            return
+        self.cache.store('status:%s:%s' % (token, endpoint),
+                         (remaining, reset))
+
+        try:
+            limit = int(response.getheader('X-RateLimit-Limit'))
+        except (TypeError, ValueError):
+            return
+        now = time.time()
+        tokens, updated, old_limit = self._bucket(token, now)
+        if limit != old_limit:
+            self.cache.store('bucket:%s' % token, (tokens, updated, limit))
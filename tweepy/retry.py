@@ -0,0 +1,136 @@
+# Tweepy
+# Copyright 2010 Joshua Roesslein
+# See LICENSE for details.
+
+import time
+import random
+import threading
+
+
+class RetryPolicy(object):
+    """Decides whether and when a failed request is sent again.
+
+    This one retries count times, delay seconds apart, on the status codes
+    in errors or on any status but 200 if errors is not given. Requests
+    that could not be sent are not retried.
+    """
+
+    def __init__(self, count=0, delay=0, errors=None):
+        self.count = count
+        self.delay = delay
+        self.errors = errors
+
+    def retry(self, attempt, method, response=None, error=None):
+        """Return the seconds to wait before the next attempt, or None
+        to give up.
+
+            attempt: retries performed so far
+            method: HTTP method of the request
+            response: response of the failed attempt, if one was received
+            error: TweepError raised if the request could not be sent
+        """
+        if attempt >= self.count or response is None:
+            return None
+        if self.errors:
+            if response.status not in self.errors:
+                return None
+        elif response.status == 200:
+            return None
+        return self.delay
+
+
+class RetryBudget(object):
+    """Retries a process may spend, refilled over time.
+
+    Shared by the policies of a process, so that while Twitter is failing
+    retries stop instead of multiplying the load.
+    """
+
+    def __init__(self, retries=30, window=60):
+        """Initialize the budget
+            retries: retries allowed per window
+            window: length of the window in seconds
+        """
+        self.retries = retries
+        self.window = window
+        self.tokens = float(retries)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def spend(self):
+        """Take one retry from the budget, False if none is left."""
+        self.lock.acquire()
+        try:
+            now = time.time()
+            rate = float(self.retries) / self.window
+            self.tokens = min(self.retries,
+                              self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+        finally:
+            self.lock.release()
+
+
+# budget of the policies not given one
+default_budget = RetryBudget()
+
+
+class BackoffRetry(RetryPolicy):
+    """Retry with exponential backoff and jitter.
+
+    Server errors and requests that could not be sent are retried, the
+    latter only for GET requests as others may have reached Twitter. The
+    wait before retry n is random up to delay * 2 ** n, capped by
+    max_delay, so failing clients do not retry in lockstep. A wait asked
+    for by Retry-After or a rate limit reset is honored, unless it is
+    longer than max_delay, then the request is not retried.
+    """
+
+    def __init__(self, count=3, delay=1, max_delay=60,
+                 errors=(500, 502, 503, 504), budget=None):
+        RetryPolicy.__init__(self, count, delay, errors)
+        self.max_delay = max_delay
+        self.budget = budget or default_budget
+
+    def wait_hint(self, response):
+        """Return the seconds the response asks to wait, if any."""
+        try:
+            return max(0, int(response.getheader('Retry-After')))
+        except (TypeError, ValueError):
+            pass
+        try:
+            if int(response.getheader('X-RateLimit-Remaining')) <= 0:
+                reset = int(response.getheader('X-RateLimit-Reset'))
+                return max(0, reset - time.time())
+        except (TypeError, ValueError):
+            pass
+        return None
+
+    def retry(self, attempt, method, response=None, error=None):
+        if attempt >= self.count:
+            return None
+
+        hint = None
+        if response is None:
+            if method != 'GET':
+                return None
+        else:
+            if response.status == 200:
+                return None
+            hint = self.wait_hint(response)
+            if hint is None and response.status not in self.errors:
+                return None
+            if hint is not None and hint > self.max_delay:
+                return None
+
+        if not self.budget.spend():
+            return None
+
+        wait = random.uniform(0, min(self.max_delay,
+                                     self.delay * 2 ** attempt))
+        if hint is not None:
+            wait = max(wait, hint)
+        return wait
@@ -96,3 +96,27 @@ def list_to_csv(item_list):
     if item_list:
         return ','.join([str(i) for i in item_list])
 
+
+
+_threads = None
+
+def threads_available():
+    """Return True if threads run concurrently in this runtime.
+
+    Sandboxes such as the App Engine Python 2.5 runtime refuse to start
+    threads, or run them in the caller like dummy_threading does.
+    """
+    global _threads
+    if _threads is None:
+        try:
+            import thread
+            import threading
+            idents = []
+            t = threading.Thread(
+                    target=lambda: idents.append(thread.get_ident()))
+            t.start()
+            t.join()
+            _threads = bool(idents) and idents[0] != thread.get_ident()
+        except Exception:
+            _threads = False
+    return _threads
@@ -25,7 +25,10 @@
 
 
 import UserDict
+import hashlib
 from Cookie import BaseCookie
+from google.appengine.api import memcache
+from tweepy import Cache
 
 
 # copied from
@@ -120,3 +123,30 @@ class Cookies(UserDict.DictMixin):
             raise KeyError(
                 "No cookie has been set with the name %r" % key)
     #end WebOb functions
+
+
+class MemcacheCache(Cache):
+    """tweepy cache kept in memcache, so it is shared by every instance.
+
+    Entries expire on their own after the timeout given at construction,
+    the timeout passed to get() is ignored.
+    """
+
+    def __init__(self, timeout=60, namespace='tweepy'):
+        Cache.__init__(self, timeout)
+        self.namespace = namespace
+
+    def _key(self, key):
+        # memcache keys are limited to 250 bytes, request URLs are not.
+        return hashlib.sha1(key).hexdigest()
+
+    def store(self, key, value):
+        memcache.set(self._key(key), value, time=self.timeout,
+                     namespace=self.namespace)
+
+    def get(self, key, timeout=None):
+        return memcache.get(self._key(key), namespace=self.namespace)
+
+    def cleanup(self):
+        # memcache evicts expired entries itself.
+        pass
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2010 Ron Huang
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+
+from datetime import datetime, timedelta
+from google.appengine.ext import db
+from models import Watermark
+
+
+TASK_DEADLINE = 30 # seconds App Engine lets a task request run
+LEASE = TASK_DEADLINE + 30 # seconds a task holds a watermark, with a margin
+
+
+def get_key(user, list_id):
+    return db.Key.from_path('Watermark', Watermark.key_name_for(list_id),
+                            parent=user.key())
+
+
+def state(mark):
+    return (mark.since_id, mark.max_id, mark.top_id)
+
+
+def seed(user, list_id):
+    """Start a watermark where the user's single watermark of old was."""
+    return Watermark(parent=user, key_name=Watermark.key_name_for(list_id),
+                     since_id=user.since_id)
+
+
+def peek(user, list_ids):
+    """Return the watermarks of the user's lists, keyed by list id."""
+    keys = [get_key(user, i) for i in list_ids]
+    marks = {}
+    for list_id, mark in zip(list_ids, db.get(keys)):
+        marks[list_id] = mark or seed(user, list_id)
+    return marks
+
+
+def needs_backfill(mark):
+    """Return True if the list has a backlog of tweets to walk through."""
+    return mark.since_id is None or mark.max_id is not None
+
+
+def claim(user, list_ids):
+    """Lease the watermarks of the user's lists, keyed by list id.
+
+    Lists leased by another task are left out, so two overlapping tasks
+    never fetch the same window.
+    """
+    def txn():
+        now = datetime.utcnow()
+        marks = {}
+        for list_id, mark in peek(user, list_ids).items():
+            if mark.leased_until is not None and mark.leased_until > now:
+                continue
+            mark.leased_until = now + timedelta(seconds=LEASE)
+            marks[list_id] = mark
+        if marks:
+            db.put(marks.values())
+        return marks
+    return db.run_in_transaction(txn)
+
+
+def unchanged(marks):
+    """Return windows releasing the watermarks without moving them."""
+    windows = {}
+    for list_id, mark in marks.items():
+        windows[list_id] = (state(mark), state(mark))
+    return windows
+
+
+def advance(user, windows):
+    """Move the watermarks of the user's lists and release them.
+
+    windows maps list ids to the (since_id, max_id, top_id) state read
+    when the list was claimed and the state to move to. A watermark that
+    changed since is left alone, so it never moves backward.
+    """
+    def txn():
+        marks = []
+        for list_id, mark in peek(user, windows.keys()).items():
+            expected, new = windows[list_id]
+            if state(mark) != expected:
+                continue
+            mark.since_id, mark.max_id, mark.top_id = new
+            mark.leased_until = None
+            marks.append(mark)
+        if marks:
+            db.put(marks)
+    db.run_in_transaction(txn)